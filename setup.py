@@ -20,11 +20,14 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     python_requires=">=3.9",
     install_requires=[
-        "selenium>=3.141.0",
+        "selenium>=4.0.0",
         "rich>=9.13.0",
         "pydantic>=1.8.2",
         "requests>=2.25.1",
     ],
+    extras_require={
+        "cache": ["cryptography>=3.4"],
+    },
     entry_points={
         "console_scripts": ["vaxup=vaxup.cli:main"],
     },
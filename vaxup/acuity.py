@@ -1,14 +1,21 @@
 import datetime
+import json
 import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any, Optional, Union
+from typing import Any, Callable, Iterator, Optional, Union
 
 import requests
 from pydantic import BaseModel, validator
 from pydantic.fields import Field
 from pydantic.types import PositiveInt
 
+from .cache import cache_path
+
 FIELD_IDS = {
     # SCHEDULING FORM
     9519119: "dob",
@@ -28,14 +35,118 @@ FIELD_IDS = {
     9730790: "vax_note",
 }
 
+# Lowercase words in each field's label on the Acuity intake forms, used to
+# find field ids when the forms change. Matched as whole words, so "city"
+# doesn't match "ethnicity".
+FIELD_LABELS = {
+    "dob": "date of birth",
+    "street_address": "street",
+    "apt": "apt",
+    "city": "city",
+    "state": "state",
+    "zip_code": "zip",
+    "race": "race",
+    "ethnicity": "ethnicity",
+    "sex": "sex",
+    "gender": "gender",
+    "has_disability": "disability",
+    "has_health_insurance": "insurance",
+    "vax_appointment_id": "vax appointment",
+    "vax_note": "vax note",
+}
+
+# Seconds before field ids are discovered again
+FIELDS_TTL = 24 * 60 * 60
+
+# Appointments per request, well above the daily amount
+PAGE_SIZE = 1_000
+
+
+@dataclass
+class FieldMap:
+    by_id: dict[int, str] = field(default_factory=lambda: FIELD_IDS.copy())
+    fetched: float = 0
+    # Fields whose id couldn't be found on the forms (the known id is kept)
+    missing: list[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        self.by_name = {v: k for k, v in self.by_id.items()}
+
+    @classmethod
+    def from_forms(cls, forms: list[dict[str, Any]]) -> "FieldMap":
+        # Starts from the known ids and replaces any field whose label
+        # matches exactly one field on the forms.
+        patterns = {
+            key: re.compile(rf"\b{re.escape(words)}\b")
+            for key, words in FIELD_LABELS.items()
+        }
+        matches: dict[str, list[int]] = {key: [] for key in FIELD_LABELS}
+        on_forms: set[int] = set()
+        for form in forms:
+            for f in form.get("fields", []):
+                on_forms.add(f["id"])
+                label = " ".join(f.get("name", "").lower().split())
+                for key, pattern in patterns.items():
+                    if pattern.search(label):
+                        matches[key].append(f["id"])
+
+        by_name = {v: k for k, v in FIELD_IDS.items()}
+        claimed = [ids[0] for ids in matches.values() if len(ids) == 1]
+        for key, ids in matches.items():
+            if len(ids) == 1 and claimed.count(ids[0]) == 1:
+                by_name[key] = ids[0]
+
+        missing = [key for key, id in by_name.items() if id not in on_forms]
+        return cls({v: k for k, v in by_name.items()}, time.time(), missing)
+
+    @classmethod
+    def load(
+        cls,
+        get_forms: Optional[Callable[[], list[dict[str, Any]]]] = None,
+        ttl: float = FIELDS_TTL,
+    ) -> "FieldMap":
+        # Cached mapping if still fresh, otherwise discovered from `get_forms`.
+        # Falls back to the cached (or known) ids if the forms can't be read.
+        path = cache_path("fields.json")
+        try:
+            cached = json.loads(path.read_text())
+            fields = cls(
+                {int(k): v for k, v in cached["by_id"].items()},
+                cached["fetched"],
+                cached.get("missing", []),
+            )
+        except (FileNotFoundError, KeyError, json.JSONDecodeError):
+            fields = cls()
+
+        if get_forms is None or time.time() - fields.fetched < ttl:
+            return fields
+
+        try:
+            fields = cls.from_forms(get_forms())
+        except requests.RequestException:
+            return fields
+
+        path.write_text(
+            json.dumps(
+                {
+                    "by_id": fields.by_id,
+                    "fetched": fields.fetched,
+                    "missing": fields.missing,
+                }
+            )
+        )
+        return fields
+
 
-def unnest_forms(forms: list[dict[str, Any]]) -> dict[str, str]:
+def unnest_forms(
+    forms: list[dict[str, Any]], field_ids: dict[int, str] = FIELD_IDS
+) -> dict[str, str]:
     # unnest acuity forms into single key-value dict
     return {
-        FIELD_IDS[v["fieldID"]]: v["value"]
+        field_ids[v["fieldID"]]: v["value"]
         for form in forms
         for v in form["values"]
-        if v["fieldID"] in FIELD_IDS
+        if v["fieldID"] in field_ids
     }
 
 
@@ -46,6 +157,7 @@ class ErrorNote(Enum):
     NOT_ELIGIBLE = "NOT ELIGIBLE"
     INVALID_FORM = "INVALID FORM"
     WALK_IN = "TO WALK IN"
+    SUBMIT_UNCONFIRMED = "SUBMIT UNCONFIRMED"
     NONE = ""
 
 
@@ -108,10 +220,19 @@ class AcuityAppointment(BaseModel):
         return self.dict().items()
 
 
+def parse_appointment(
+    apt: dict[str, Any], field_ids: dict[int, str] = FIELD_IDS
+) -> AcuityAppointment:
+    # Raw appointment from the Acuity API, with intake forms unnested
+    forms = unnest_forms(apt["forms"], field_ids)
+    return AcuityAppointment(**({k: v for k, v in apt.items() if k != "forms"} | forms))
+
+
 @dataclass
 class AcuityAPI:
     session: requests.Session = field(default_factory=requests.Session)
     base_url: str = "https://acuityscheduling.com/api/v1"
+    _fields: Optional[FieldMap] = field(default=None, init=False, repr=False)
 
     def __post_init__(self):
         # If session is missing auth, inspect environment
@@ -125,9 +246,15 @@ class AcuityAPI:
             "response": lambda r, *args, **kwargs: r.raise_for_status()
         }
 
+    @property
+    def fields(self) -> FieldMap:
+        # Discovered once per process, and cached on disk between runs
+        if self._fields is None:
+            self._fields = FieldMap.load(self.get_forms)
+        return self._fields
+
     def _unnest(self, apt: dict[str, Any]) -> AcuityAppointment:
-        forms = unnest_forms(apt.pop("forms"))
-        return AcuityAppointment(**(apt | forms))
+        return parse_appointment(apt, self.fields.by_id)
 
     def url(self, path: str) -> str:
         base = self.base_url.rstrip("/")
@@ -142,17 +269,96 @@ class AcuityAPI:
         res = self.session.get(self.url(f"/appointments/{id}"))
         return self._unnest(res.json())
 
-    def get_appointments(
-        self, date: datetime.date, canceled: bool = False
-    ) -> list[AcuityAppointment]:
+    def _get_page(
+        self, start: datetime.datetime, end: datetime.datetime, canceled: bool
+    ) -> list[dict[str, Any]]:
+        # Appointments from `start` through `end` (inclusive, to the minute)
         params = {
-            "max": 10_000,  # well above daily amount
-            "minDate": f"{date}T00:00",
-            "maxDate": f"{date}T23:59",
+            "max": PAGE_SIZE,
+            "minDate": start.strftime("%Y-%m-%dT%H:%M"),
+            "maxDate": end.strftime("%Y-%m-%dT%H:%M"),
             "canceled": "true" if canceled else "false",
+            "direction": "ASC",
         }
         res = self.session.get(self.url("/appointments"), params=params)
-        return [self._unnest(d) for d in res.json()]
+        return res.json()
+
+    def iter_raw_appointments(
+        self,
+        date: datetime.date,
+        canceled: bool = False,
+        end: Optional[datetime.date] = None,
+    ) -> Iterator[dict[str, Any]]:
+        # Appointments on `date`, or from `date` through `end` (inclusive).
+        #
+        # Fetched one day at a time, while the previous day is consumed. A
+        # full page may have been cut off, so its window is split in half
+        # and fetched again until every page fits.
+        minute = datetime.timedelta(minutes=1)
+        windows = deque(
+            (
+                datetime.datetime.combine(day, datetime.time(0, 0)),
+                datetime.datetime.combine(day, datetime.time(23, 59)),
+            )
+            for day in (
+                date + datetime.timedelta(days=i)
+                for i in range(((end or date) - date).days + 1)
+            )
+        )
+        seen: set[int] = set()
+        pool = ThreadPoolExecutor(max_workers=1)
+
+        def fetch():
+            window = windows.popleft()
+            return window, pool.submit(self._get_page, *window, canceled)
+
+        try:
+            current = fetch() if windows else None
+            while current is not None:
+                (start, stop), future = current
+                page = future.result()
+                if len(page) >= PAGE_SIZE and stop > start:
+                    middle = (start + (stop - start) // 2).replace(
+                        second=0, microsecond=0
+                    )
+                    windows.extendleft([(middle + minute, stop), (start, middle)])
+                    current = fetch()
+                    continue
+
+                current = fetch() if windows else None
+                for appt in page:
+                    # Rescheduled while paging, an appointment could show up twice
+                    if appt["id"] not in seen:
+                        seen.add(appt["id"])
+                        yield appt
+        finally:
+            # A caller that stops early doesn't wait for the prefetched page
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    def iter_appointments(
+        self,
+        date: datetime.date,
+        canceled: bool = False,
+        end: Optional[datetime.date] = None,
+    ) -> Iterator[AcuityAppointment]:
+        for raw in self.iter_raw_appointments(date, canceled=canceled, end=end):
+            yield self._unnest(raw)
+
+    def get_raw_appointments(
+        self,
+        date: datetime.date,
+        canceled: bool = False,
+        end: Optional[datetime.date] = None,
+    ) -> list[dict[str, Any]]:
+        return list(self.iter_raw_appointments(date, canceled=canceled, end=end))
+
+    def get_appointments(
+        self,
+        date: datetime.date,
+        canceled: bool = False,
+        end: Optional[datetime.date] = None,
+    ) -> list[AcuityAppointment]:
+        return list(self.iter_appointments(date, canceled=canceled, end=end))
 
     def edit_appointment(self, id: int, fields: dict[str, str]) -> AcuityAppointment:
         assert len(fields) > 0, "Must provide dict with fields to update."
@@ -167,7 +373,7 @@ class AcuityAPI:
 
         # Iterate through remaining form fields (if any)
         if len(fields) > 0:
-            id_map = {v: k for k, v in FIELD_IDS.items()}
+            id_map = self.fields.by_name
             fields_list = [{"id": id_map[k], "value": v} for k, v in fields.items()]
             data |= {"fields": fields_list}
 
@@ -0,0 +1,9 @@
+import os
+from pathlib import Path
+
+CACHE_DIR = Path(os.environ.get("VAXUP_CACHE_DIR", "~/.cache/vaxup")).expanduser()
+
+
+def cache_path(name: str) -> Path:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    return CACHE_DIR / name
@@ -1,24 +1,86 @@
 import argparse
 import datetime
 import sys
+from pathlib import Path
 
+from .dedupe import DEFAULT_WINDOW
+from .loadtest import LoadConfig
+from .loadtest import loadtest as run_loadtest
+from .profiling import enable_io_tracing, print_io_summary, run_profiled
+from .utils import api
 from .utils import cancel as cancel_appointment
 from .utils import check as check_appointments
 from .utils import check_id as check_appointment_id
+from .utils import dedupe as dedupe_appointments
 from .utils import enroll as enroll_appointments
+from .utils import export as export_appointments
 from .utils import unenroll as unenroll_appointment
 
 
 def check(args: argparse.Namespace) -> None:
-    check_appointments(date=args.date, fix=args.fix)
+    check_appointments(
+        date=args.date,
+        fix=args.fix,
+        format=args.format,
+        from_file=args.from_file,
+        jobs=args.jobs,
+        end=args.end,
+    )
 
 
 def enroll(args: argparse.Namespace) -> None:
-    enroll_appointments(date=args.date, dry_run=args.dry_run)
+    enroll_appointments(
+        date=args.date,
+        dry_run=args.dry_run,
+        dedupe_window=args.dedupe,
+        prescan_times=args.prescan,
+        tag_unavailable=args.tag_unavailable,
+        preflight_rules=args.preflight,
+        session_cache=args.session_cache,
+        browser_profile=args.browser_profile,
+        queue=args.queue,
+        worker=args.worker,
+        from_file=args.from_file,
+        jobs=args.jobs,
+    )
+
+
+def export(args: argparse.Namespace) -> None:
+    output = args.output or Path(
+        f"vaxup-{args.start}_{args.end or args.start}.jsonl.gz"
+    )
+    export_appointments(start=args.start, end=args.end, output=output)
+
+
+def dedupe(args: argparse.Namespace) -> None:
+    dedupe_appointments(date=args.date, window=args.window, dry_run=args.dry_run)
+
+
+def loadtest(args: argparse.Namespace) -> None:
+    config = LoadConfig(
+        acuity_latency=args.acuity_latency,
+        acuity_failure_rate=args.acuity_failure_rate,
+        login_latency=args.login_latency,
+        step_latency=args.step_latency,
+        enroll_failure_rate=args.failure_rate,
+        session_expiry_rate=args.session_expiry_rate,
+        slot_gone_rate=args.slot_gone_rate,
+        speedup=args.speedup,
+    )
+    run_loadtest(
+        appointments=args.appointments,
+        workers=args.workers,
+        batch_sizes=args.batch_sizes,
+        config=config,
+    )
 
 
 def unenroll(args: argparse.Namespace) -> None:
-    unenroll_appointment(acuity_id=args.acuity_id)
+    unenroll_appointment(
+        acuity_id=args.acuity_id,
+        session_cache=args.session_cache,
+        browser_profile=args.browser_profile,
+    )
 
 
 def check_id(args: argparse.Namespace) -> None:
@@ -34,34 +96,124 @@ def main() -> None:
     subparsers = parser.add_subparsers(dest="command")
     subparsers.required = True
 
+    # options shared by all commands
+    common = argparse.ArgumentParser(add_help=False)
+    common.add_argument(
+        "--profile", type=Path, nargs="?", const=Path("vaxup.pstats"), metavar="PATH"
+    )
+    common.add_argument("--trace-io", action="store_true")
+
     # check
-    parser_check = subparsers.add_parser("check")
+    parser_check = subparsers.add_parser("check", parents=[common])
     parser_check.add_argument("date", type=datetime.date.fromisoformat)
-    parser_check.add_argument("--fix", action="store_true")
+    parser_check.add_argument("end", type=datetime.date.fromisoformat, nargs="?")
+    group = parser_check.add_mutually_exclusive_group()
+    group.add_argument("--fix", action="store_true")
+    group.add_argument("--format", choices=("table", "jsonl", "csv"), default="table")
+    parser_check.add_argument("--from-file", type=Path, metavar="PATH")
+    parser_check.add_argument("-j", "--jobs", type=int, default=1)
     parser_check.set_defaults(func=check)
 
     # enroll
-    parser_check = subparsers.add_parser("enroll")
+    parser_check = subparsers.add_parser("enroll", parents=[common])
     parser_check.add_argument("date", type=datetime.date.fromisoformat)
-    parser_check.add_argument("--dry-run", action="store_true")
+    group = parser_check.add_mutually_exclusive_group()
+    group.add_argument("--dry-run", action="store_true")
+    group.add_argument("--queue", type=Path, metavar="PATH")
+    parser_check.add_argument("--worker")
+    parser_check.add_argument("--from-file", type=Path, metavar="PATH")
+    parser_check.add_argument("-j", "--jobs", type=int, default=1)
+    parser_check.add_argument(
+        "--dedupe", type=int, nargs="?", const=DEFAULT_WINDOW, metavar="DAYS"
+    )
+    parser_check.add_argument("--prescan", action="store_true")
+    parser_check.add_argument("--tag-unavailable", action="store_true")
+    parser_check.add_argument("--preflight", action="store_true")
+    parser_check.add_argument(
+        "--no-session-cache", dest="session_cache", action="store_false"
+    )
+    parser_check.add_argument(
+        "--browser-profile", choices=("default", "fast"), default="fast"
+    )
     parser_check.set_defaults(func=enroll)
 
+    # dedupe
+    parser_dedupe = subparsers.add_parser("dedupe", parents=[common])
+    parser_dedupe.add_argument("date", type=datetime.date.fromisoformat)
+    parser_dedupe.add_argument("--window", type=int, default=DEFAULT_WINDOW)
+    parser_dedupe.add_argument("--dry-run", action="store_true")
+    parser_dedupe.set_defaults(func=dedupe)
+
+    # export
+    parser_export = subparsers.add_parser("export", parents=[common])
+    parser_export.add_argument("start", type=datetime.date.fromisoformat)
+    parser_export.add_argument("end", type=datetime.date.fromisoformat, nargs="?")
+    parser_export.add_argument("-o", "--output", type=Path)
+    parser_export.set_defaults(func=export)
+
+    # loadtest
+    defaults = LoadConfig()
+    parser_loadtest = subparsers.add_parser("loadtest", parents=[common])
+    parser_loadtest.add_argument("--appointments", type=int, default=2000)
+    parser_loadtest.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4])
+    parser_loadtest.add_argument("--batch-sizes", type=int, nargs="+", default=[1])
+    parser_loadtest.add_argument(
+        "--acuity-latency", type=float, default=defaults.acuity_latency
+    )
+    parser_loadtest.add_argument(
+        "--acuity-failure-rate", type=float, default=defaults.acuity_failure_rate
+    )
+    parser_loadtest.add_argument(
+        "--login-latency", type=float, default=defaults.login_latency
+    )
+    parser_loadtest.add_argument(
+        "--step-latency", type=float, default=defaults.step_latency
+    )
+    parser_loadtest.add_argument(
+        "--failure-rate", type=float, default=defaults.enroll_failure_rate
+    )
+    parser_loadtest.add_argument(
+        "--session-expiry-rate", type=float, default=defaults.session_expiry_rate
+    )
+    parser_loadtest.add_argument(
+        "--slot-gone-rate", type=float, default=defaults.slot_gone_rate
+    )
+    parser_loadtest.add_argument("--speedup", type=float, default=defaults.speedup)
+    parser_loadtest.set_defaults(func=loadtest)
+
     # unenroll
-    parser_unenroll = subparsers.add_parser("unenroll")
+    parser_unenroll = subparsers.add_parser("unenroll", parents=[common])
     parser_unenroll.add_argument("acuity_id", type=int)
+    parser_unenroll.add_argument(
+        "--no-session-cache", dest="session_cache", action="store_false"
+    )
+    parser_unenroll.add_argument(
+        "--browser-profile", choices=("default", "fast"), default="fast"
+    )
     parser_unenroll.set_defaults(func=unenroll)
 
     # check_id
-    parser_check_id = subparsers.add_parser("check-id")
+    parser_check_id = subparsers.add_parser("check-id", parents=[common])
     parser_check_id.add_argument("acuity_id", type=int)
     parser_check_id.add_argument("--add-note", action="store_true")
     parser_check_id.add_argument("--raw", action="store_true")
     parser_check_id.set_defaults(func=check_id)
 
     # cancel
-    parser_cancel = subparsers.add_parser("cancel")
+    parser_cancel = subparsers.add_parser("cancel", parents=[common])
     parser_cancel.add_argument("acuity_id", type=int)
     parser_cancel.set_defaults(func=cancel)
 
     ns = parser.parse_args(sys.argv[1:])
-    ns.func(ns)
+
+    if ns.trace_io:
+        enable_io_tracing(api.session)
+
+    try:
+        if ns.profile:
+            run_profiled(lambda: ns.func(ns), output=ns.profile)
+        else:
+            ns.func(ns)
+    finally:
+        if ns.trace_io:
+            print_io_summary()
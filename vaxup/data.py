@@ -1,12 +1,22 @@
 import datetime
+import math
 import re
+from concurrent.futures import ProcessPoolExecutor
 from enum import Enum
-from typing import Literal, Optional
+from functools import partial
+from itertools import islice
+from typing import Any, Iterable, Iterator, Literal, Optional, Sized
 
-from pydantic import BaseModel, validator
+from pydantic import BaseModel, ValidationError, validator
 from pydantic.types import PositiveInt
 
-from .acuity import AcuityAppointment, ErrorNote, Location
+from .acuity import (
+    FIELD_IDS,
+    AcuityAppointment,
+    ErrorNote,
+    Location,
+    parse_appointment,
+)
 
 # Copied from VAX website <input name='email' pattern='....' />
 REGEXES = {
@@ -167,3 +177,58 @@ class VaxAppointment(BaseModel):
 
     def __rich_repr__(self):
         return self.dict().items()
+
+
+# Acuity appointment, validated appointment (if valid) and fields with errors
+Validated = tuple[AcuityAppointment, Optional[VaxAppointment], list[str]]
+
+# Batches per worker process, so a slow batch doesn't hold up the rest
+BATCHES_PER_JOB = 4
+
+
+def validate(raw: dict[str, Any], field_ids: dict[int, str] = FIELD_IDS) -> Validated:
+    appt = parse_appointment(raw, field_ids)
+    try:
+        return appt, VaxAppointment.from_acuity(appt), []
+    except ValidationError as e:
+        return appt, None, [err["loc"][0] for err in e.errors()]
+
+
+def _validate_batch(
+    batch: list[dict[str, Any]], field_ids: dict[int, str] = FIELD_IDS
+) -> list[Validated]:
+    return [validate(raw, field_ids) for raw in batch]
+
+
+def _batched(records: Iterable[dict[str, Any]], size: int):
+    it = iter(records)
+    while batch := list(islice(it, size)):
+        yield batch
+
+
+def validate_appointments(
+    records: Iterable[dict[str, Any]],
+    jobs: int = 1,
+    batch_size: Optional[int] = None,
+    field_ids: dict[int, str] = FIELD_IDS,
+) -> Iterator[Validated]:
+    """Validates raw Acuity appointments, in order.
+
+    With `jobs > 1`, batches of records are validated in a pool of worker
+    processes, which speeds up audits over many days of appointments.
+    Unless given, the batch size is chosen so each process gets
+    `BATCHES_PER_JOB` batches.
+    """
+    if jobs <= 1:
+        yield from map(partial(validate, field_ids=field_ids), records)
+        return
+
+    if batch_size is None:
+        batches = jobs * BATCHES_PER_JOB
+        sized = isinstance(records, Sized)
+        batch_size = max(1, math.ceil(len(records) / batches)) if sized else 500
+
+    validate_batch = partial(_validate_batch, field_ids=field_ids)
+    with ProcessPoolExecutor(max_workers=jobs) as pool:
+        for batch in pool.map(validate_batch, _batched(records, batch_size)):
+            yield from batch
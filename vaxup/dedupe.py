@@ -0,0 +1,106 @@
+import datetime
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Iterable, Optional
+
+from .acuity import AcuityAppointment, ErrorNote
+
+# Days of Acuity history searched for a previous (first dose) registration.
+DEFAULT_WINDOW = 42
+
+
+def _normalize(s: Optional[str]) -> str:
+    # "O'Neil " -> "oneil"
+    return re.sub(r"[^a-z0-9]", "", (s or "").lower())
+
+
+def _normalize_phone(s: Optional[str]) -> str:
+    # "+1 (212) 555-1234" -> "2125551234"
+    return re.sub(r"[^0-9]", "", s or "")[-10:]
+
+
+def person_keys(appt: AcuityAppointment) -> list[tuple[str, ...]]:
+    # Family members frequently share an email or phone, so contact
+    # details only identify a person in combination with their name.
+    # These secondary keys catch typos in the date of birth.
+    first, last = _normalize(appt.first_name), _normalize(appt.last_name)
+    keys = [("dob", first, last, _normalize(appt.dob))]
+    if email := appt.email.strip().lower():
+        keys.append(("email", first, last, email))
+    if phone := _normalize_phone(appt.phone):
+        keys.append(("phone", first, last, phone))
+    return keys
+
+
+def is_pending(appt: AcuityAppointment) -> bool:
+    # Active appointment that `enroll` would attempt to register
+    return (
+        not appt.canceled
+        and appt.vax_appointment_id is None
+        and appt.vax_note in (None, ErrorNote.NONE)
+    )
+
+
+@dataclass
+class DuplicateIndex:
+    _index: dict[tuple[str, ...], list[AcuityAppointment]] = field(
+        default_factory=lambda: defaultdict(list)
+    )
+
+    def add(self, appt: AcuityAppointment) -> None:
+        for key in person_keys(appt):
+            self._index[key].append(appt)
+
+    def matches(self, appt: AcuityAppointment) -> list[AcuityAppointment]:
+        found: dict[int, AcuityAppointment] = {}
+        for key in person_keys(appt):
+            for other in self._index.get(key, []):
+                if other.id != appt.id:
+                    found[other.id] = other
+        return sorted(found.values(), key=lambda e: e.id)
+
+
+@dataclass
+class Duplicate:
+    appt: AcuityAppointment
+    note: ErrorNote
+    match: AcuityAppointment
+
+
+def find_duplicates(
+    appts: Iterable[AcuityAppointment], history: Iterable[AcuityAppointment]
+) -> list[Duplicate]:
+    """Flags pending appointments that are likely second doses or duplicates.
+
+    `history` holds appointments prior to the day of `appts`. Any earlier
+    appointment registered on VAX means a second dose was already scheduled
+    with the first. On the same day, an appointment is a duplicate if the
+    person is registered already or has another pending appointment with a
+    lower Acuity id (the one that is kept).
+    """
+    history_index, day_index = DuplicateIndex(), DuplicateIndex()
+    for appt in history:
+        if not appt.canceled and appt.vax_appointment_id:
+            history_index.add(appt)
+
+    appts = [appt for appt in appts if not appt.canceled]
+    for appt in appts:
+        day_index.add(appt)
+
+    duplicates = []
+    for appt in filter(is_pending, appts):
+        if first_dose := history_index.matches(appt):
+            duplicates.append(Duplicate(appt, ErrorNote.SECOND_DOSE, first_dose[0]))
+            continue
+        for other in day_index.matches(appt):
+            if other.vax_appointment_id or (is_pending(other) and other.id < appt.id):
+                duplicates.append(Duplicate(appt, ErrorNote.ALREADY_SCHEDULED, other))
+                break
+    return duplicates
+
+
+def history_range(
+    date: datetime.date, window: int = DEFAULT_WINDOW
+) -> tuple[datetime.date, datetime.date]:
+    return date - datetime.timedelta(days=window), date - datetime.timedelta(days=1)
@@ -0,0 +1,131 @@
+import json
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, Optional
+
+from selenium.common.exceptions import NoSuchElementException, TimeoutException
+
+from .acuity import Location
+from .cache import cache_path
+
+# Timeouts (seconds) used until enough latencies have been observed
+DEFAULT_TIMEOUTS = {
+    "element": 5,
+    "select_date": 10,
+    "login": 15,
+    "select_location": 15,
+}
+
+MIN_SAMPLES = 20
+MAX_SAMPLES = 500
+MIN_TIMEOUT = 2
+
+# Share of recent waits that may time out before VAX is assumed to be slow
+MAX_MISS_RATE = 0.2
+
+
+def percentile(samples: list[float], q: float) -> float:
+    # Nearest-rank percentile, `q` between 0 and 1
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class LatencyModel:
+    """Observed VAX latencies per step and location, persisted between runs.
+
+    Timeouts are twice the 99th percentile of recent samples for a step at a
+    location (or across locations if there are too few), bounded between
+    `MIN_TIMEOUT` and three times the default. Only waits that succeed are
+    samples: an element that is simply absent (a slot that is gone, a form
+    with errors) says nothing about how fast VAX is. Waits that time out
+    are counted instead, and when more than `MAX_MISS_RATE` of recent waits
+    do, the timeout is raised back to at least the default.
+    """
+
+    def __init__(self, path: Optional[Path] = None):
+        self._path = path or cache_path("latency.json")
+        self._samples: dict[str, list[float]] = {}
+        # 1 for a wait that timed out, 0 for one that succeeded
+        self._outcomes: dict[str, list[int]] = {}
+        self.chosen: dict[str, float] = {}
+        try:
+            data = json.loads(self._path.read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            data = {}
+        if "samples" in data:
+            self._samples, self._outcomes = data["samples"], data["outcomes"]
+
+    @staticmethod
+    def _keys(step: str, location: Optional[Location]) -> list[str]:
+        keys = [f"{step}:*"]
+        if location is not None:
+            keys.insert(0, f"{step}:{location.name}")
+        return keys
+
+    def _recent(self, step: str, location: Optional[Location]) -> list[float]:
+        for key in self._keys(step, location):
+            samples = self._samples.get(key, [])
+            if len(samples) >= MIN_SAMPLES:
+                return samples
+        return []
+
+    def _outcome(self, step: str, missed: bool, location: Optional[Location]) -> None:
+        for key in self._keys(step, location):
+            outcomes = self._outcomes.setdefault(key, [])
+            outcomes.append(int(missed))
+            del outcomes[:-MAX_SAMPLES]
+
+    def _miss_rate(self, step: str, location: Optional[Location]) -> float:
+        for key in self._keys(step, location):
+            outcomes = self._outcomes.get(key, [])
+            if len(outcomes) >= MIN_SAMPLES:
+                return sum(outcomes) / len(outcomes)
+        return 0.0
+
+    def record(
+        self, step: str, seconds: float, location: Optional[Location] = None
+    ) -> None:
+        for key in self._keys(step, location):
+            samples = self._samples.setdefault(key, [])
+            samples.append(round(seconds, 3))
+            del samples[:-MAX_SAMPLES]
+        self._outcome(step, False, location)
+
+    def miss(self, step: str, location: Optional[Location] = None) -> None:
+        self._outcome(step, True, location)
+
+    @contextmanager
+    def measure(self, step: str, location: Optional[Location] = None) -> Iterator:
+        # Other errors (e.g. a stale element) are neither samples nor misses
+        start = time.perf_counter()
+        try:
+            yield
+        except (NoSuchElementException, TimeoutException):
+            self.miss(step, location)
+            raise
+        self.record(step, time.perf_counter() - start, location)
+
+    def timeout(self, step: str, location: Optional[Location] = None) -> float:
+        default = DEFAULT_TIMEOUTS[step]
+        samples = self._recent(step, location)
+        if samples:
+            value = min(max(2 * percentile(samples, 0.99), MIN_TIMEOUT), 3 * default)
+        else:
+            value = default
+        if self._miss_rate(step, location) > MAX_MISS_RATE:
+            value = max(value, default)
+        self.chosen[self._keys(step, location)[0]] = value
+        return value
+
+    def poll_frequency(self, step: str, location: Optional[Location] = None) -> float:
+        # Poll often when a step is usually fast, back off when it is slow
+        samples = self._recent(step, location)
+        if not samples:
+            return 0.5
+        return min(max(percentile(samples, 0.5) / 5, 0.05), 0.5)
+
+    def save(self) -> None:
+        self._path.write_text(
+            json.dumps({"samples": self._samples, "outcomes": self._outcomes})
+        )
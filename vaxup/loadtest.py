@@ -0,0 +1,357 @@
+import copy
+import datetime
+import random
+import tempfile
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Iterator, Optional, Union
+
+from requests.exceptions import HTTPError
+from rich import box
+from rich.console import Console
+from rich.table import Table
+from selenium.common.exceptions import WebDriverException
+
+from .acuity import (
+    FIELD_IDS,
+    AcuityAPI,
+    AcuityAppointment,
+    ErrorNote,
+    FieldMap,
+    Location,
+)
+from .data import VaxAppointment
+from .latency import percentile
+from .utils import console, enroll_from_queue
+from .web import SessionExpired, SlotUnavailable
+from .workqueue import WorkQueue
+
+# Form filling steps in `AuthorizedEnroller.schedule_appointment`
+ENROLL_STEPS = 6
+
+
+@dataclass
+class LoadConfig:
+    # Latencies in (simulated) seconds, failure rates between 0 and 1
+    acuity_latency: float = 0.3
+    acuity_failure_rate: float = 0.0
+    login_latency: float = 10.0
+    step_latency: float = 2.0
+    enroll_failure_rate: float = 0.02
+    session_expiry_rate: float = 0.005
+    slot_gone_rate: float = 0.01
+    # Simulated seconds per wall clock second. Only paces the run: results
+    # are read from the simulated clock, so they don't depend on it.
+    speedup: float = 100.0
+
+
+class SimClock:
+    """Simulated seconds, kept per thread (each thread is one worker).
+
+    Only simulated latency advances the clock, so real overhead (SQLite,
+    parsing, thread switches) isn't scaled up with the speedup.
+    """
+
+    def __init__(self, speedup: float = 100.0):
+        self.speedup = speedup
+        self._local = threading.local()
+
+    def now(self) -> float:
+        return getattr(self._local, "now", 0.0)
+
+    def sleep(self, seconds: float) -> None:
+        # Jittered so that workers don't move in lockstep
+        seconds *= random.uniform(0.5, 1.5)
+        self._local.now = self.now() + seconds
+        time.sleep(seconds / self.speedup)
+
+
+@dataclass
+class Metrics:
+    # Times are read from `clock`, in the thread of the worker concerned
+    clock: SimClock = field(default_factory=SimClock)
+    registered: dict[int, float] = field(default_factory=dict)
+    written: dict[int, float] = field(default_factory=dict)
+    latencies: list[float] = field(default_factory=list)
+    finished: list[float] = field(default_factory=list)
+    failures: int = 0
+    tagged: int = 0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+def fake_appointments(
+    n: int, date: datetime.date, seed: int = 0
+) -> list[dict[str, Any]]:
+    # Raw Acuity appointments spread across locations and the day
+    rng = random.Random(seed)
+    by_name = {v: k for k, v in FIELD_IDS.items()}
+    forms = {
+        "dob": "01/01/1980",
+        "street_address": "1 Main St",
+        "apt": "",
+        "city": "New York",
+        "state": "NY",
+        "zip_code": "10001",
+        "race": "Other",
+        "ethnicity": "Prefer not to answer",
+        "sex": "Unknown",
+        "gender": "Unknown",
+        "has_disability": "no",
+        "has_health_insurance": "yes",
+        "vax_appointment_id": "",
+        "vax_note": "",
+    }
+    appts = []
+    for i in range(1, n + 1):
+        start = datetime.datetime.combine(date, datetime.time(9))
+        start += datetime.timedelta(minutes=5 * rng.randrange(96))
+        appts.append(
+            {
+                "id": i,
+                "firstName": f"First{i}",
+                "lastName": f"Last{i}",
+                "phone": "",
+                "email": f"person{i}@example.com",
+                "notes": "",
+                "datetime": start.isoformat(),
+                "calendar": rng.choice(list(Location)).value,
+                "canceled": False,
+                "forms": [
+                    {
+                        "values": [
+                            {"fieldID": by_name[k], "value": v}
+                            for k, v in forms.items()
+                        ]
+                    }
+                ],
+            }
+        )
+    return appts
+
+
+@dataclass
+class FakeAcuityAPI(AcuityAPI):
+    """In-memory `AcuityAPI` with simulated latency and failures."""
+
+    appts: dict[int, dict[str, Any]] = field(default_factory=dict)
+    config: LoadConfig = field(default_factory=LoadConfig)
+    metrics: Metrics = field(default_factory=Metrics)
+
+    def __post_init__(self):
+        self._fields = FieldMap()
+        self._lock = threading.Lock()
+
+    def _request(self) -> None:
+        self.metrics.clock.sleep(self.config.acuity_latency)
+        if random.random() < self.config.acuity_failure_rate:
+            raise HTTPError("Simulated Acuity failure.")
+
+    def iter_raw_appointments(
+        self,
+        date: datetime.date,
+        canceled: bool = False,
+        end: Optional[datetime.date] = None,
+    ) -> Iterator[dict[str, Any]]:
+        self._request()
+        yield from (a for a in self.appts.values() if a["canceled"] == canceled)
+
+    def get_appointment(self, id: int) -> AcuityAppointment:
+        self._request()
+        with self._lock:
+            return self._unnest(self.appts[id])
+
+    def _set_field(self, id: int, name: str, value: str) -> AcuityAppointment:
+        self._request()
+        with self._lock:
+            for v in self.appts[id]["forms"][0]["values"]:
+                if v["fieldID"] == self.fields.by_name[name]:
+                    v["value"] = value
+            return self._unnest(self.appts[id])
+
+    def set_vax_id(self, id: int, vax_id: Union[str, None]) -> AcuityAppointment:
+        appt = self._set_field(id, "vax_appointment_id", vax_id or "")
+        with self.metrics.lock:
+            self.metrics.written[id] = self.metrics.clock.now()
+        return appt
+
+    def set_vax_note(self, id: int, note: ErrorNote) -> AcuityAppointment:
+        appt = self._set_field(id, "vax_note", note.value)
+        with self.metrics.lock:
+            self.metrics.tagged += 1
+        return appt
+
+
+class FakeEnroller:
+    """Stand-in for `AuthorizedEnroller` with simulated VAX latency."""
+
+    def __init__(self, config: LoadConfig, metrics: Metrics):
+        self._config = config
+        self._metrics = metrics
+        self._current_location: Optional[Location] = None
+
+    def schedule_appointment(self, appt: VaxAppointment) -> str:
+        clock = self._metrics.clock
+        start = clock.now()
+        if appt.location != self._current_location:
+            clock.sleep(self._config.login_latency)
+            self._current_location = appt.location
+        for _ in range(ENROLL_STEPS):
+            clock.sleep(self._config.step_latency)
+
+        # One draw, so the rates add up to the chance of any failure
+        roll = random.random()
+        for error, rate in (
+            (
+                WebDriverException("Simulated VAX failure."),
+                self._config.enroll_failure_rate,
+            ),
+            (
+                SessionExpired("Simulated expired session."),
+                self._config.session_expiry_rate,
+            ),
+            (SlotUnavailable("Simulated slot taken."), self._config.slot_gone_rate),
+        ):
+            if roll < rate:
+                with self._metrics.lock:
+                    self._metrics.failures += 1
+                raise error
+            roll -= rate
+
+        end = clock.now()
+        with self._metrics.lock:
+            self._metrics.registered[appt.id] = end
+            self._metrics.latencies.append(end - start)
+        return f"VAX{appt.id}"
+
+    def expire_session(self) -> None:
+        self._current_location = None
+
+
+@dataclass
+class LoadResult:
+    workers: int
+    batch_size: int
+    registered: int
+    failures: int
+    tagged: int
+    per_minute: float
+    latency_p50: float
+    latency_p99: float
+    lag_p50: float
+    lag_p99: float
+
+
+def run(
+    appts: list[dict[str, Any]],
+    workers: int,
+    batch_size: int,
+    config: LoadConfig,
+    date: datetime.date,
+) -> LoadResult:
+    """Registers `appts` through the queue-based enroll path with fakes.
+
+    Durations in the result are in simulated seconds.
+    """
+    metrics = Metrics(clock=SimClock(config.speedup))
+    acuity = FakeAcuityAPI(
+        appts={a["id"]: a for a in appts}, config=config, metrics=metrics
+    )
+    with tempfile.TemporaryDirectory() as tmp:
+        work = WorkQueue(Path(tmp) / "queue.db")
+        work.add(VaxAppointment.from_acuity(acuity._unnest(a)) for a in appts)
+
+        def worker(**kwargs):
+            enroll_from_queue(**kwargs)
+            with metrics.lock:
+                metrics.finished.append(metrics.clock.now())
+
+        threads = [
+            threading.Thread(
+                target=worker,
+                kwargs=dict(
+                    enroller=FakeEnroller(config, metrics),
+                    work=work,
+                    date=date,
+                    worker=f"worker-{i}",
+                    batch_size=batch_size,
+                    acuity=acuity,
+                ),
+            )
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    # Workers run side by side, so the run lasts as long as the slowest
+    elapsed = max(metrics.finished, default=0.0)
+    lags = [
+        metrics.written[id] - t
+        for id, t in metrics.registered.items()
+        if id in metrics.written
+    ] or [0.0]
+    latencies = metrics.latencies or [0.0]
+    return LoadResult(
+        workers=workers,
+        batch_size=batch_size,
+        registered=len(metrics.registered),
+        failures=metrics.failures,
+        tagged=metrics.tagged,
+        per_minute=60 * len(metrics.registered) / elapsed if elapsed else 0.0,
+        latency_p50=percentile(latencies, 0.5),
+        latency_p99=percentile(latencies, 0.99),
+        lag_p50=percentile(lags, 0.5),
+        lag_p99=percentile(lags, 0.99),
+    )
+
+
+def loadtest(
+    appointments: int,
+    workers: list[int],
+    batch_sizes: list[int],
+    config: LoadConfig,
+) -> None:
+    # Registers fake appointments through the queue-based enroll path with
+    # simulated Acuity and VAX latency, for each combination of settings.
+    date = datetime.date.today()
+    appts = fake_appointments(appointments, date)
+
+    table = Table(show_header=True, box=box.SIMPLE_HEAD)
+    table.add_column("workers", justify="right", style="magenta")
+    table.add_column("batch", justify="right", style="magenta")
+    table.add_column("registered", justify="right")
+    table.add_column("failures", justify="right", style="red")
+    table.add_column("tagged", justify="right", style="yellow")
+    table.add_column("per min.", justify="right", style="bold green")
+    table.add_column("latency p50/p99", justify="right")
+    table.add_column("write-back p50/p99", justify="right")
+
+    report = Console()
+    console.quiet = True
+    try:
+        for num_workers in workers:
+            for batch_size in batch_sizes:
+                with report.status(
+                    f"Simulating {appointments} appointments with "
+                    f"{num_workers} worker(s), batch size {batch_size}"
+                ):
+                    result = run(
+                        copy.deepcopy(appts), num_workers, batch_size, config, date
+                    )
+                table.add_row(
+                    str(result.workers),
+                    str(result.batch_size),
+                    str(result.registered),
+                    str(result.failures),
+                    str(result.tagged),
+                    f"{result.per_minute:.1f}",
+                    f"{result.latency_p50:.1f}s / {result.latency_p99:.1f}s",
+                    f"{result.lag_p50:.2f}s / {result.lag_p99:.2f}s",
+                )
+    finally:
+        console.quiet = False
+
+    report.print(table)
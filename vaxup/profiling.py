@@ -0,0 +1,87 @@
+import cProfile
+import pstats
+import sys
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Callable
+
+import requests
+from rich.console import Console
+from selenium import webdriver
+
+# Profiling output goes to stderr, so it can't be confused with command output
+console = Console(stderr=True)
+
+# kind -> name -> [count, total seconds]
+_io_totals: dict[str, dict[str, list]] = defaultdict(
+    lambda: defaultdict(lambda: [0, 0.0])
+)
+_io_tracing = False
+
+
+def _record(kind: str, name: str, detail: str, seconds: float) -> None:
+    totals = _io_totals[kind][name]
+    totals[0] += 1
+    totals[1] += seconds
+    console.log(f"[dim]{kind}[/dim] {detail} [bold]{seconds:.3f}s[/bold]")
+
+
+def _log_response(r: requests.Response, *args, **kwargs) -> None:
+    _record(
+        "http",
+        r.request.method,
+        f"{r.request.method} {r.url} {r.status_code}",
+        r.elapsed.total_seconds(),
+    )
+
+
+def enable_io_tracing(session: requests.Session) -> None:
+    # Logs every request made with `session` and any WebDriver created after
+    global _io_tracing
+    _io_tracing = True
+    hooks = session.hooks.get("response", [])
+    hooks = [hooks] if callable(hooks) else list(hooks)
+    # Log before any hook that raises for bad responses
+    session.hooks["response"] = [_log_response, *hooks]
+
+
+def instrument_driver(driver: webdriver.Remote) -> None:
+    # No-op unless IO tracing is enabled
+    if not _io_tracing:
+        return
+
+    execute = driver.command_executor.execute
+
+    def timed_execute(command: str, params: dict[str, Any]):
+        start = time.perf_counter()
+        try:
+            return execute(command, params)
+        finally:
+            _record("webdriver", command, command, time.perf_counter() - start)
+
+    driver.command_executor.execute = timed_execute
+
+
+def print_io_summary() -> None:
+    for kind, names in _io_totals.items():
+        for name, (count, seconds) in sorted(
+            names.items(), key=lambda e: e[1][1], reverse=True
+        ):
+            console.print(
+                f"{kind:>9} {name:<28} {count:>6} calls {seconds:>9.3f}s total"
+            )
+
+
+def run_profiled(func: Callable[[], Any], output: Path, top: int = 25) -> None:
+    # Runs `func` under cProfile and writes stats readable with `pstats`
+    # or tools like snakeviz. Commands may exit early with `sys.exit`.
+    profile = cProfile.Profile()
+    try:
+        profile.runcall(func)
+    finally:
+        profile.dump_stats(output)
+        console.rule(f"Profile (top {top} by cumulative time)")
+        stats = pstats.Stats(profile, stream=sys.stderr)
+        stats.strip_dirs().sort_stats("cumulative").print_stats(top)
+        console.print(f"Wrote profile to [bold]{output}[/bold]")
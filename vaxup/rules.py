@@ -0,0 +1,93 @@
+import json
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from .cache import cache_path
+from .data import VaxAppointment
+from .web import ETHNICITY, GENDER, RACE, SEX, AuthorizedEnroller
+
+# Seconds before the VAX form is scraped again
+RULES_TTL = 7 * 24 * 60 * 60
+
+# VAX input name -> (appointment field, value typed by the enroller).
+# Date of birth and phone are left out: VAX masks them as they're typed, so
+# their constraints apply to a value other than the one typed.
+INPUTS: dict[str, tuple[str, Callable[[VaxAppointment], Optional[str]]]] = {
+    "firstName": ("first_name", lambda a: a.first_name),
+    "lastName": ("last_name", lambda a: a.last_name),
+    "email": ("email", lambda a: a.email),
+    "street": ("street_address", lambda a: a.street_address),
+    "zip": ("zip_code", lambda a: a.zip_code),
+    "city": ("city", lambda a: a.city),
+    "aptNo": ("apt", lambda a: a.apt),
+}
+
+# VAX dropdown (or checkbox) name -> (appointment field, option selected)
+OPTIONS: dict[str, tuple[str, Callable[[VaxAppointment], str]]] = {
+    "state": ("state", lambda a: a.state),
+    "ethencity": ("ethnicity", lambda a: ETHNICITY[a.ethnicity]),
+    "sex": ("sex", lambda a: SEX[a.sex]),
+    "gender": ("gender", lambda a: GENDER[a.gender]),
+    "races": ("race", lambda a: RACE[a.race]),
+}
+
+
+@dataclass
+class FormRules:
+    """Constraints of the VAX personal information form.
+
+    Scraped from the live form, so appointments the form would reject can
+    be found before any browser work.
+    """
+
+    inputs: dict[str, dict[str, str]] = field(default_factory=dict)
+    options: dict[str, list[str]] = field(default_factory=dict)
+    scraped: float = 0
+
+    def __post_init__(self):
+        # HTML patterns must match the whole value
+        self._patterns = {}
+        for name, attrs in self.inputs.items():
+            try:
+                self._patterns[name] = re.compile(f"^(?:{attrs['pattern']})$")
+            except (KeyError, re.error):
+                pass
+
+    @classmethod
+    def scrape(cls, enroller: AuthorizedEnroller, appt: VaxAppointment) -> "FormRules":
+        return cls(**enroller.scrape_form_rules(appt), scraped=time.time())
+
+    @classmethod
+    def load(cls, ttl: float = RULES_TTL) -> Optional["FormRules"]:
+        try:
+            data = json.loads(cache_path("vax_form.json").read_text())
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        rules = cls(**data)
+        return rules if time.time() - rules.scraped < ttl else None
+
+    def save(self) -> None:
+        data = {"inputs": self.inputs, "options": self.options, "scraped": self.scraped}
+        cache_path("vax_form.json").write_text(json.dumps(data))
+
+    def check(self, appt: VaxAppointment) -> list[str]:
+        # Fields of `appt` that the VAX form would reject
+        fields = []
+        for name, (field_name, get_value) in INPUTS.items():
+            value, attrs = get_value(appt), self.inputs.get(name, {})
+            if not value:
+                continue
+            if "maxlength" in attrs and len(value) > int(attrs["maxlength"]):
+                fields.append(field_name)
+            elif "minlength" in attrs and len(value) < int(attrs["minlength"]):
+                fields.append(field_name)
+            elif name in self._patterns and not self._patterns[name].match(value):
+                fields.append(field_name)
+
+        for name, (field_name, get_value) in OPTIONS.items():
+            # Options that couldn't be scraped aren't checked
+            if self.options.get(name) and get_value(appt) not in self.options[name]:
+                fields.append(field_name)
+        return fields
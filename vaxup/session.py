@@ -0,0 +1,59 @@
+import base64
+import hashlib
+import json
+import os
+from typing import Any, Optional
+
+try:
+    from cryptography.fernet import Fernet, InvalidToken
+except ImportError:
+    Fernet = None
+
+from .cache import cache_path
+
+# Salesforce expires idle sessions well before this
+MAX_AGE = 12 * 60 * 60
+
+
+class SessionCache:
+    """VAX session cookies for a login, encrypted at rest.
+
+    The key is derived from the login password, so a cache file can only be
+    read by someone who could log in anyway. Requires the optional
+    `cryptography` package (`pip install vaxup[cache]`); without it nothing
+    is written to disk.
+    """
+
+    def __init__(self, username: str, password: str):
+        digest = hashlib.sha256(username.encode()).hexdigest()[:16]
+        self._path = cache_path(f"session-{digest}.bin")
+        self._fernet = None
+        if Fernet is not None:
+            key = hashlib.pbkdf2_hmac(
+                "sha256", password.encode(), digest.encode(), 100_000
+            )
+            self._fernet = Fernet(base64.urlsafe_b64encode(key))
+
+    @property
+    def enabled(self) -> bool:
+        return self._fernet is not None
+
+    def load(self) -> Optional[list[dict[str, Any]]]:
+        if not self.enabled:
+            return None
+        try:
+            token = self._path.read_bytes()
+            return json.loads(self._fernet.decrypt(token, ttl=MAX_AGE))
+        except (FileNotFoundError, InvalidToken):
+            return None
+
+    def save(self, cookies: list[dict[str, Any]]) -> None:
+        if not self.enabled:
+            return
+        token = self._fernet.encrypt(json.dumps(cookies).encode())
+        fd = os.open(self._path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+        with os.fdopen(fd, "wb") as f:
+            f.write(token)
+
+    def clear(self) -> None:
+        self._path.unlink(missing_ok=True)
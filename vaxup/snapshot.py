@@ -0,0 +1,81 @@
+import datetime
+import gzip
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Iterable, Iterator, Optional, TextIO
+
+from .acuity import AcuityAPI, AcuityAppointment, FieldMap
+
+
+def _open(path: Path, mode: str) -> TextIO:
+    if path.suffix == ".gz":
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def write_snapshot(path: Path, records: Iterable[dict[str, Any]]) -> int:
+    # One raw Acuity appointment (as returned by the API) per line
+    n = 0
+    with _open(path, "w") as f:
+        for record in records:
+            f.write(json.dumps(record, separators=(",", ":")) + "\n")
+            n += 1
+    return n
+
+
+def read_snapshot(path: Path) -> Iterator[dict[str, Any]]:
+    # Parses one line at a time, so memory doesn't grow with the file
+    with _open(path, "r") as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+@dataclass
+class SnapshotAPI(AcuityAPI):
+    """Read-only stand-in for `AcuityAPI` backed by an exported snapshot."""
+
+    path: Optional[Path] = None
+
+    def __post_init__(self):
+        # No credentials or network access needed
+        if self.path is None:
+            raise ValueError("Must provide path to snapshot.")
+        self.path = Path(self.path)
+
+    @property
+    def fields(self) -> FieldMap:
+        # Field ids from the last time they were discovered, never fetched
+        if self._fields is None:
+            self._fields = FieldMap.load()
+        return self._fields
+
+    def iter_raw_appointments(
+        self,
+        date: datetime.date,
+        canceled: bool = False,
+        end: Optional[datetime.date] = None,
+    ) -> Iterator[dict[str, Any]]:
+        # Acuity datetimes are ISO 8601, so the date is the first 10 chars
+        start, end = date.isoformat(), (end or date).isoformat()
+        for record in read_snapshot(self.path):
+            if (
+                record["canceled"] == canceled
+                and start <= record["datetime"][:10] <= end
+            ):
+                yield record
+
+    def get_appointment(self, id: int) -> AcuityAppointment:
+        for record in read_snapshot(self.path):
+            if record["id"] == id:
+                return self._unnest(record)
+        raise KeyError(f"Appointment {id} not in {self.path}.")
+
+    def edit_appointment(self, id: int, fields: dict[str, str]) -> AcuityAppointment:
+        raise RuntimeError("Snapshots are read-only.")
+
+    def cancel_appointment(
+        self, id: int, cancel_note: Optional[str] = None
+    ) -> AcuityAppointment:
+        raise RuntimeError("Snapshots are read-only.")
@@ -0,0 +1,149 @@
+import datetime
+import sys
+from array import array
+from typing import Any, Iterable, Iterator, Optional
+
+from .acuity import ErrorNote, Location
+from .data import (
+    DATE_FORMAT,
+    TIME_FORMAT,
+    Ethnicity,
+    Gender,
+    Race,
+    Sex,
+    VaxAppointment,
+)
+
+EPOCH = datetime.datetime(1970, 1, 1)
+
+# Stored as the (small int) index of the member, -1 for `None`
+ENUMS = {
+    "location": list(Location),
+    "race": list(Race),
+    "ethnicity": list(Ethnicity),
+    "sex": list(Sex),
+    "gender": list(Gender),
+    "vax_note": list(ErrorNote),
+}
+
+# Packed into a single byte per appointment
+FLAGS = ("canceled", "has_disability", "has_health_insurance")
+
+# Few distinct values, so each is stored once
+INTERNED = ("state", "city", "zip_code")
+
+STRINGS = (
+    "first_name",
+    "last_name",
+    "email",
+    "street_address",
+    "apt",
+    "vax_appointment_id",
+)
+
+
+class AppointmentStore:
+    """Validated appointments stored column by column.
+
+    Holds the same data as a list of `VaxAppointment`, but as typed arrays
+    and lists rather than one model (and dict) per appointment. Items are
+    lightweight `CompactAppointment` views, created on access.
+    """
+
+    def __init__(self, appts: Iterable[VaxAppointment] = ()):
+        self._id = array("Q")
+        self._phone = array("q")
+        self._datetime = array("q")
+        self._dob = array("l")
+        self._flags = array("B")
+        self._enums = {name: array("b") for name in ENUMS}
+        self._strings: dict[str, list[Optional[str]]] = {
+            name: [] for name in (*INTERNED, *STRINGS)
+        }
+        self.extend(appts)
+
+    def append(self, appt: VaxAppointment) -> None:
+        self._id.append(appt.id)
+        self._phone.append(-1 if appt.phone is None else appt.phone)
+        self._datetime.append(int((appt.datetime - EPOCH).total_seconds()))
+        self._dob.append(appt.dob.toordinal())
+        self._flags.append(
+            sum(1 << i for i, name in enumerate(FLAGS) if getattr(appt, name))
+        )
+        for name, members in ENUMS.items():
+            value = getattr(appt, name)
+            self._enums[name].append(-1 if value is None else members.index(value))
+        for name in INTERNED:
+            self._strings[name].append(sys.intern(getattr(appt, name)))
+        for name in STRINGS:
+            self._strings[name].append(getattr(appt, name))
+
+    def extend(self, appts: Iterable[VaxAppointment]) -> None:
+        for appt in appts:
+            self.append(appt)
+
+    def get(self, name: str, index: int) -> Any:
+        if name == "id":
+            return self._id[index]
+        if name == "phone":
+            phone = self._phone[index]
+            return None if phone == -1 else phone
+        if name == "datetime":
+            return EPOCH + datetime.timedelta(seconds=self._datetime[index])
+        if name == "dob":
+            return datetime.date.fromordinal(self._dob[index])
+        if name in FLAGS:
+            return bool(self._flags[index] & (1 << FLAGS.index(name)))
+        if name in ENUMS:
+            code = self._enums[name][index]
+            return None if code == -1 else ENUMS[name][code]
+        if name in self._strings:
+            return self._strings[name][index]
+        raise AttributeError(name)
+
+    def __len__(self) -> int:
+        return len(self._id)
+
+    def __getitem__(self, index: int) -> "CompactAppointment":
+        if not -len(self) <= index < len(self):
+            raise IndexError(index)
+        return CompactAppointment(self, index % len(self))
+
+    def __iter__(self) -> Iterator["CompactAppointment"]:
+        return (CompactAppointment(self, i) for i in range(len(self)))
+
+
+class CompactAppointment:
+    """Read-only view of one appointment in an `AppointmentStore`.
+
+    Exposes the same attributes as `VaxAppointment`.
+    """
+
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store: AppointmentStore, index: int):
+        self._store = store
+        self._index = index
+
+    def __getattr__(self, name: str) -> Any:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self._store.get(name, self._index)
+
+    @property
+    def date_str(self):
+        return self.datetime.strftime(DATE_FORMAT)
+
+    @property
+    def time_str(self):
+        return self.datetime.strftime(TIME_FORMAT)
+
+    @property
+    def dob_str(self):
+        return self.dob.strftime(DATE_FORMAT)
+
+    def dict(self) -> dict[str, Any]:
+        return {name: getattr(self, name) for name in VaxAppointment.__fields__}
+
+    def __rich_repr__(self):
+        return self.dict().items()
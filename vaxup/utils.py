@@ -1,24 +1,69 @@
+import csv
 import datetime
+import json
 import os
+import socket
 import sys
+from collections import Counter
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from itertools import groupby
-from typing import Iterable, Optional
+from pathlib import Path
+from typing import Any, Iterable, Literal, Optional, TextIO
 
 from pydantic import ValidationError
-from requests.exceptions import HTTPError
+from requests.exceptions import HTTPError, RequestException
 from rich import box
 from rich.console import Console
 from rich.prompt import Confirm, Prompt
 from rich.table import Table
+from selenium.common.exceptions import WebDriverException
 
 from .acuity import AcuityAPI, AcuityAppointment, ErrorNote
-from .data import VaxAppointment
-from .web import AuthorizedEnroller
+from .data import VaxAppointment, validate_appointments
+from .dedupe import DEFAULT_WINDOW, find_duplicates, history_range, is_pending
+from .rules import FormRules
+from .snapshot import SnapshotAPI, write_snapshot
+from .store import AppointmentStore
+from .web import (
+    AuthorizedEnroller,
+    BrowserProfile,
+    FormRejected,
+    SessionExpired,
+    SlotUnavailable,
+    SubmitUnconfirmed,
+)
+from .workqueue import WorkQueue
 
 console = Console()
 api = AcuityAPI()
 
+OutputFormat = Literal["table", "jsonl", "csv"]
+Registration = Literal["registered", "failed", "unconfirmed"]
+
+# Further attempts after a flaky page load or an expired session
+MAX_RETRIES = 2
+
+# Share of pending appointments a single form rule may reject before the
+# rule is assumed to be scraped wrong and ignored, once there are at least
+# `MIN_PREFLIGHT` pending appointments to judge by
+MAX_REJECTED = 0.5
+MIN_PREFLIGHT = 10
+
+# Failures retrying won't fix, and the note they're tagged with on Acuity.
+# An unconfirmed submit may have registered the appointment, so it's left
+# for someone to check on VAX rather than resubmitted.
+PERMANENT_FAILURES = {
+    SlotUnavailable: ErrorNote.TIME_NOT_AVAILABLE,
+    FormRejected: ErrorNote.INVALID_FORM,
+    SubmitUnconfirmed: ErrorNote.SUBMIT_UNCONFIRMED,
+}
+
+
+def get_source(from_file: Optional[Path] = None) -> AcuityAPI:
+    # Appointments are read from Acuity, or from a snapshot written by `export`
+    return api if from_file is None else SnapshotAPI(path=from_file)
+
 
 def get_vax_login():
     username = os.environ.get("VAXUP_USERNAME")
@@ -89,34 +134,167 @@ class VaxupTable:
         return self._table
 
 
-def check(date: datetime.date, fix: bool = False) -> None:
-    with console.status(f"Fetching appointments for {date}", spinner="earth"):
-        appts = api.get_appointments(date)
-        appts += api.get_appointments(date, canceled=True)
+class VaxupRecords:
+    """Streams one record per appointment as JSON lines or CSV.
+
+    Unlike `VaxupTable`, rows are written immediately and never buffered,
+    so output can be piped into other tools.
+    """
+
+    columns = (
+        "id",
+        "location",
+        "date",
+        "time",
+        "fields",
+        "vax_id",
+        "canceled",
+        "note",
+    )
+
+    def __init__(self, format: OutputFormat, file: Optional[TextIO] = None):
+        # Resolved here, so stdout redirected after import is respected
+        file = sys.stdout if file is None else file
+        self._format = format
+        self._file = file
+        self._writer = None
+        if format == "csv":
+            self._writer = csv.writer(file)
+            self._writer.writerow(self.columns)
+
+    def add_row(
+        self,
+        appt: AcuityAppointment,
+        issue_fields: Optional[list[str]] = None,
+    ) -> None:
+        row = (
+            appt.id,
+            appt.location.name,
+            appt.datetime.date().isoformat(),
+            appt.datetime.strftime("%I:%M %p"),
+            issue_fields or [],
+            appt.vax_appointment_id or "",
+            appt.canceled,
+            appt.vax_note.value if appt.vax_note else "",
+        )
+        if self._writer is not None:
+            self._writer.writerow((*row[:4], ";".join(row[4]), *row[5:]))
+        else:
+            self._file.write(json.dumps(dict(zip(self.columns, row))) + "\n")
+        self._file.flush()
+
+
+def field_ids(source: AcuityAPI) -> dict[int, str]:
+    # Intake form field ids of `source`, warning about any that went missing
+    fields = source.fields
+    if fields.missing:
+        Console(stderr=True).print(
+            "[yellow bold]WARNING[/yellow bold] not found on the Acuity intake "
+            f"forms, using known ids: {', '.join(fields.missing)}"
+        )
+    return fields.by_id
+
+
+def get_raw_appointments(
+    date: datetime.date,
+    from_file: Optional[Path] = None,
+    end: Optional[datetime.date] = None,
+) -> list[dict[str, Any]]:
+    # Active and canceled appointments, as returned by the Acuity API
+    source = get_source(from_file)
+    return source.get_raw_appointments(date, end=end) + source.get_raw_appointments(
+        date, canceled=True, end=end
+    )
+
+
+def date_range(date: datetime.date, end: Optional[datetime.date] = None) -> str:
+    return str(date) if end is None else f"{date} to {end}"
 
-    num_appts = len(appts)
+
+def check_records(
+    date: datetime.date,
+    format: OutputFormat,
+    from_file: Optional[Path] = None,
+    jobs: int = 1,
+    end: Optional[datetime.date] = None,
+) -> None:
+    # Status and summary go to stderr to keep stdout machine-readable
+    err_console = Console(stderr=True)
+    num_appts, num_active, num_issues = 0, 0, 0
+
+    with err_console.status(
+        f"Fetching appointments for {date_range(date, end)}", spinner="earth"
+    ):
+        raw = get_raw_appointments(date, from_file=from_file, end=end)
+
+    try:
+        records = VaxupRecords(format)
+        for appt, _, issue_fields in validate_appointments(
+            raw, jobs=jobs, field_ids=field_ids(get_source(from_file))
+        ):
+            records.add_row(appt, issue_fields=issue_fields)
+            num_appts += 1
+            num_active += not appt.canceled
+            num_issues += bool(issue_fields) and not appt.canceled
+    except BrokenPipeError:
+        # The reader (e.g. `head`) is done. Point stdout at devnull so the
+        # flush at interpreter exit doesn't fail again, and exit quietly.
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
+
+    err_console.print(
+        f"{num_appts} appointments ({num_active} active), {num_issues} need fixing"
+    )
+
+
+def check(
+    date: datetime.date,
+    fix: bool = False,
+    format: OutputFormat = "table",
+    from_file: Optional[Path] = None,
+    jobs: int = 1,
+    end: Optional[datetime.date] = None,
+) -> None:
+    if fix and from_file is not None:
+        console.print("[red bold]Snapshots are read-only, can't use --fix[/red bold]")
+        sys.exit(1)
+
+    if format != "table":
+        return check_records(
+            date=date, format=format, from_file=from_file, jobs=jobs, end=end
+        )
+
+    with console.status(
+        f"Fetching appointments for {date_range(date, end)}", spinner="earth"
+    ):
+        raw = get_raw_appointments(date, from_file=from_file, end=end)
 
     # no appointments
-    if num_appts == 0:
-        console.print(f"No appointments scheduled for {date} :calendar:")
+    if len(raw) == 0:
+        console.print(
+            f"No appointments scheduled for {date_range(date, end)} :calendar:"
+        )
         sys.exit(0)
 
-    issues: list[tuple[AcuityAppointment, list[str]]] = []
+    # Only ids are kept; `fix_issues` fetches each appointment when it's due
+    issues: list[tuple[int, list[str]]] = []
+
+    # Just report active appointment numbers
+    num_appts = 0
 
     table = VaxupTable()
-    for appt in appts:
-        try:
-            VaxAppointment.from_acuity(appt)
+    for appt, _, issue_fields in validate_appointments(
+        raw, jobs=jobs, field_ids=field_ids(get_source(from_file))
+    ):
+        num_appts += not appt.canceled
+        if not issue_fields:
             table.add_row(appt, style="green")
-        except ValidationError as e:
-            issue_fields = [err["loc"][0] for err in e.errors()]
+        else:
             table.add_row(appt, issue_fields=issue_fields)
             if not appt.canceled:
                 # only edit appts that aren't canceled
-                issues.append((appt, issue_fields))
-
-    # Just report active appointment numbers
-    num_appts = len([apt for apt in appts if not apt.canceled])
+                issues.append((appt.id, issue_fields))
+    del raw
 
     # no errors
     if len(issues) == 0:
@@ -132,113 +310,517 @@ def check(date: datetime.date, fix: bool = False) -> None:
     )
     console.print(table)
     if not fix:
+        dates = f"{date} {end}" if end else str(date)
         console.print(
-            f"Run [yellow]vaxup check {date} --fix[/yellow] to fix interactively."
+            f"Run [yellow]vaxup check {dates} --fix[/yellow] to fix interactively."
         )
     else:
-        for appt, fields in issues:
+        fix_issues(issues)
+
+
+def field_errors(appt: AcuityAppointment, updates: dict[str, str]) -> dict[str, str]:
+    # Validation errors by field for `appt` with `updates` applied
+    try:
+        data = appt.dict(by_alias=True) | updates
+        VaxAppointment.from_acuity(AcuityAppointment.parse_obj(data))
+    except ValidationError as e:
+        return {err["loc"][0]: err["msg"] for err in e.errors()}
+    return {}
+
+
+def submit_fix(id: int, fields: dict[str, str]) -> str:
+    # Runs in the background; re-validates what Acuity returns
+    try:
+        appt = api.edit_appointment(id, fields=fields)
+    except (RequestException, ValidationError) as e:
+        return f"[red bold]Failed[/red bold] to update {id}: {e}"
+    if errors := field_errors(appt, {}):
+        return f"[yellow bold]Still invalid[/yellow bold] {id}: {', '.join(errors)}"
+    return f"[green bold]Updated[/green bold] {id}"
+
+
+def fix_issues(issues: list[tuple[int, list[str]]]) -> None:
+    # Each value is validated as it is entered. Confirmed edits are sent to
+    # Acuity in the background, so the next prompt doesn't wait on the API.
+    # Appointments are fetched one ahead of the one being fixed.
+    pending: list[Future] = []
+
+    def report(wait: bool = False):
+        for future in list(pending):
+            if wait or future.done():
+                console.print(future.result())
+                pending.remove(future)
+
+    with ThreadPoolExecutor(max_workers=4) as pool:
+
+        def fetch(i: int) -> Future:
+            return pool.submit(api.get_appointment, issues[i][0])
+
+        upcoming = fetch(0) if issues else None
+        for i, (id, fields) in enumerate(issues):
+            report()
+            current = upcoming
+            upcoming = fetch(i + 1) if i + 1 < len(issues) else None
+            try:
+                appt = current.result()
+            except (RequestException, ValidationError) as e:
+                console.print(f"[red bold]Failed[/red bold] to fetch {id}: {e}")
+                continue
             updates: list[FieldUpdate] = []
             for field in fields:
                 value = getattr(appt, field)
-                update = Prompt.ask(field, default=value, console=console)
+                while True:
+                    update = Prompt.ask(field, default=value, console=console)
+                    fixed = {f.name: f.new for f in updates} | {field: update}
+                    error = field_errors(appt, fixed).get(field)
+                    # Keeping the current value skips the field
+                    if error is None or update == value:
+                        break
+                    console.print(f"[red]{error}[/red]")
                 if update != value:
                     updates.append(FieldUpdate(field, value, update))
             text = "\n".join(map(lambda f: f.__rich__(), updates))
             if len(updates) > 0 and Confirm.ask(text, console=console):
-                api.edit_appointment(appt.id, fields={f.name: f.new for f in updates})
+                pending.append(
+                    pool.submit(submit_fix, appt.id, {f.name: f.new for f in updates})
+                )
             console.print()
 
+        with console.status(f"Waiting for {len(pending)} update(s)"):
+            report(wait=True)
+
 
 def groupby_location(vax_appts: Iterable[VaxAppointment]):
     sorted_appts = sorted(vax_appts, key=lambda e: e.location.value)
     return groupby(sorted_appts, key=lambda e: e.location)
 
 
-def enroll(date: datetime.date, dry_run: bool = False) -> None:
+def dedupe(
+    date: datetime.date,
+    window: int = DEFAULT_WINDOW,
+    dry_run: bool = False,
+    from_file: Optional[Path] = None,
+) -> set[int]:
+    start, end = history_range(date, window)
+    source = get_source(from_file)
+    with console.status(
+        f"Fetching appointments for {date} and {start} to {end}", spinner="earth"
+    ):
+        appts = source.get_appointments(date)
+        history = source.get_appointments(start, end=end)
+
+    duplicates = find_duplicates(appts, history)
+    if len(duplicates) == 0:
+        console.print(f"No duplicates or second doses found for {date} :tada:")
+        return set()
+
+    with console.status(f"Tagging {len(duplicates)} appointment(s)") as status:
+        for dup in duplicates:
+            line = (
+                f"[yellow bold]{dup.note.value}[/yellow bold]\t- "
+                f"{dup.appt.location.name} {dup.appt.id} "
+                f"{dup.appt.datetime.strftime('%I:%M %p')} - "
+                f"matches {dup.match.id} ({dup.match.datetime.date()})"
+            )
+            if not dry_run:
+                try:
+                    api.set_vax_note(id=dup.appt.id, note=dup.note)
+                except HTTPError:
+                    line += " - [red bold]failed to tag on Acuity"
+            console.log(line)
+
+    return {dup.appt.id for dup in duplicates}
+
+
+def prescan(
+    enroller: AuthorizedEnroller,
+    vax_appts: list[VaxAppointment],
+    tag: bool = False,
+) -> set[int]:
+    # Loads each (location, date) page once and returns the ids of pending
+    # appointments whose time slot is no longer offered on VAX. A page that
+    # fails to load, or shows no times at all, isn't trusted: its
+    # appointments are left for registration to find out.
+    unavailable: set[int] = set()
+    pending = sorted(
+        filter(is_pending, vax_appts), key=lambda e: (e.location.value, e.datetime)
+    )
+    for (location, date), appts in groupby(
+        pending, key=lambda e: (e.location, e.date_str)
+    ):
+        try:
+            times = enroller.available_times(location=location, date=date)
+        except WebDriverException as e:
+            console.log(
+                f"[yellow bold]WARNING[/yellow bold] couldn't prescan {location.name} on {date}: {e!r}"
+            )
+            continue
+        if not times:
+            console.log(
+                f"[yellow bold]WARNING[/yellow bold] no times showing for {location.name} on {date}, not prescanned."
+            )
+            continue
+        for appt in appts:
+            if appt.time_str in times:
+                continue
+            unavailable.add(appt.id)
+            if tag:
+                try:
+                    api.set_vax_note(id=appt.id, note=ErrorNote.TIME_NOT_AVAILABLE)
+                except HTTPError:
+                    console.log(
+                        f"[yellow bold]WARNING[/yellow bold] failed to tag {appt.id} as time not available on Acuity."
+                    )
+    return unavailable
+
+
+def preflight(
+    rules: FormRules,
+    vax_appts: list[VaxAppointment],
+    tag: bool = False,
+) -> set[int]:
+    # Returns the ids of pending appointments the VAX form would reject,
+    # found without opening a single slot.
+    pending = list(filter(is_pending, vax_appts))
+    failing = {appt.id: rules.check(appt) for appt in pending}
+    rejected = Counter(name for fields in failing.values() for name in fields)
+    ignored = (
+        {name for name, n in rejected.items() if n > MAX_REJECTED * len(pending)}
+        if len(pending) >= MIN_PREFLIGHT
+        else set()
+    )
+    if ignored:
+        console.log(
+            f"[yellow bold]WARNING[/yellow bold] ignoring VAX form rules for {', '.join(sorted(ignored))}, which reject most appointments."
+        )
+
+    invalid: set[int] = set()
+    for appt in pending:
+        if not (fields := [f for f in failing[appt.id] if f not in ignored]):
+            continue
+        invalid.add(appt.id)
+        console.log(enroll_msg(appt, "Invalid", "red", ", ".join(fields)))
+        if tag:
+            try:
+                api.set_vax_note(id=appt.id, note=ErrorNote.INVALID_FORM)
+            except HTTPError:
+                console.log(
+                    f"[yellow bold]WARNING[/yellow bold] failed to tag {appt.id} as invalid form on Acuity."
+                )
+    return invalid
+
+
+def skip_reason(
+    vax_appt: VaxAppointment,
+    duplicate_ids: set[int] = frozenset(),
+    unavailable: set[int] = frozenset(),
+    invalid: set[int] = frozenset(),
+) -> Optional[str]:
+    # Why `enroll` won't register an appointment, if at all
+    if vax_appt.canceled:
+        return "Appointment is canceled on Acuity."
+    if vax_appt.vax_appointment_id:
+        return f"Appt #: {vax_appt.vax_appointment_id}"
+    if vax_appt.id in duplicate_ids:
+        return "Likely duplicate or second dose."
+    if vax_appt.id in unavailable:
+        return f"[bold yellow]{ErrorNote.TIME_NOT_AVAILABLE.value}"
+    if vax_appt.id in invalid:
+        return f"[bold yellow]{ErrorNote.INVALID_FORM.value}"
+    if vax_appt.vax_note is not ErrorNote.NONE:
+        return f"[bold yellow]{vax_appt.vax_note.value}"
+    return None
+
+
+def enroll_msg(vax_appt: VaxAppointment, tag: str, color: str, data=None) -> str:
+    line = f"{vax_appt.location.name} {vax_appt.id} {vax_appt.time_str}"
+    line = f"[{color} bold]{tag}[/{color} bold]\t- {line}"
+    return line if not data else line + f" - {data}"
+
+
+def record_failure(
+    vax_appt: VaxAppointment,
+    error: Exception,
+    dry_run: bool = False,
+    acuity: Optional[AcuityAPI] = None,
+) -> Registration:
+    if isinstance(error, SubmitUnconfirmed):
+        console.log(
+            enroll_msg(vax_appt, "Unconfirmed", "red", "check VAX before re-running")
+        )
+        outcome = "unconfirmed"
+    else:
+        console.log(enroll_msg(vax_appt, "Failure", "red"))
+        outcome = "failed"
+    console.log(error)
+    console.print(vax_appt)
+    note = PERMANENT_FAILURES.get(type(error))
+    if note is not None and not dry_run:
+        try:
+            (acuity or api).set_vax_note(id=vax_appt.id, note=note)
+        except HTTPError:
+            console.log(
+                f"[yellow bold]WARNING[/yellow bold] failed to tag {vax_appt.id} as {note.value.lower()} on Acuity."
+            )
+    return outcome
+
+
+def register(
+    enroller: AuthorizedEnroller,
+    vax_appt: VaxAppointment,
+    dry_run: bool = False,
+    acuity: Optional[AcuityAPI] = None,
+) -> Registration:
+    # Registers a single appointment on VAX and tags Acuity with the VAX id.
+    # Flaky page loads and expired sessions are retried (each attempt starts
+    # from a freshly loaded page); slots that are gone, forms VAX rejects and
+    # submits that may or may not have gone through are tagged on Acuity
+    # instead.
+    acuity = acuity or api
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            vax_id = enroller.schedule_appointment(appt=vax_appt)
+            break
+        except (SessionExpired, WebDriverException) as e:
+            if attempt == MAX_RETRIES:
+                return record_failure(vax_appt, e, dry_run=dry_run, acuity=acuity)
+            if isinstance(e, SessionExpired):
+                enroller.expire_session()
+            console.log(enroll_msg(vax_appt, "Retrying", "yellow", repr(e)))
+        except Exception as e:
+            return record_failure(vax_appt, e, dry_run=dry_run, acuity=acuity)
+
+    console.log(
+        enroll_msg(vax_appt, "Success", "green", f"Appt #: {vax_id or 'DRY_RUN'}")
+    )
+    if not dry_run:
+        try:
+            acuity.set_vax_id(id=vax_appt.id, vax_id=vax_id)
+        except HTTPError:
+            console.log(
+                f"[yellow bold]WARNING[/yellow bold] failed tag {vax_appt.id} with Appointment #: {vax_id} on Acuity, but VAX registration was sucessful."
+            )
+    return "registered"
+
+
+def enroll_from_queue(
+    enroller: AuthorizedEnroller,
+    work: WorkQueue,
+    date: datetime.date,
+    worker: str,
+    dry_run: bool = False,
+    batch_size: int = 1,
+    acuity: Optional[AcuityAPI] = None,
+) -> None:
+    # Leases `batch_size` appointments at a time until none are left for
+    # `date`. Each one is fetched again from Acuity first, in case another
+    # worker already registered it.
+    acuity = acuity or api
+    location = None
+    while ids := work.lease(
+        worker, date=date.isoformat(), location=location, limit=batch_size
+    ):
+        with work.heartbeat(ids, worker):
+            for id in ids:
+                try:
+                    vax_appt = VaxAppointment.from_acuity(acuity.get_appointment(id))
+                except (HTTPError, ValidationError) as e:
+                    console.log(f"[red bold]Failure[/red bold]\t- {id} - {e}")
+                    work.release(id, worker, error=str(e))
+                    continue
+
+                if reason := skip_reason(vax_appt):
+                    console.log(enroll_msg(vax_appt, "Skipped", "yellow", reason))
+                    work.complete(id, worker, vax_id=vax_appt.vax_appointment_id)
+                    continue
+
+                # Renewing fails if the lease expired and another worker
+                # took the appointment over while this one was busy
+                if not work.renew(id, worker):
+                    console.log(enroll_msg(vax_appt, "Lost lease", "yellow"))
+                    continue
+
+                location = vax_appt.location
+                outcome = register(enroller, vax_appt, dry_run=dry_run, acuity=acuity)
+
+                if outcome == "registered":
+                    # Acuity holds the VAX id (none on a dry run); the queue
+                    # only records completion
+                    held = work.complete(id, worker)
+                elif outcome == "unconfirmed":
+                    # Never handed back: another worker would submit it again
+                    held = work.fail(id, worker, error="Submit unconfirmed")
+                else:
+                    held = work.release(id, worker, error="Failed to register")
+                if not held:
+                    console.log(
+                        f"[yellow bold]WARNING[/yellow bold] lost the lease on {id} while registering."
+                    )
+
+    counts = ", ".join(
+        f"{n} {status}" for status, n in work.counts(date.isoformat()).items()
+    )
+    console.log(f"[bold]Queue empty for {date}[/bold] ({counts})")
+
+
+def enroll(
+    date: datetime.date,
+    dry_run: bool = False,
+    dedupe_window: Optional[int] = None,
+    prescan_times: bool = False,
+    tag_unavailable: bool = False,
+    preflight_rules: bool = False,
+    session_cache: bool = True,
+    browser_profile: BrowserProfile = "fast",
+    queue: Optional[Path] = None,
+    worker: Optional[str] = None,
+    from_file: Optional[Path] = None,
+    jobs: int = 1,
+) -> None:
+
+    if from_file is not None and not dry_run:
+        console.print("[red bold]Snapshots can only be enrolled with --dry-run")
+        sys.exit(1)
+
+    # Skipped below; tags are only written to Acuity when not a dry run.
+    duplicate_ids = (
+        dedupe(date, window=dedupe_window, dry_run=dry_run, from_file=from_file)
+        if dedupe_window is not None
+        else set()
+    )
 
     with console.status(f"Fetching appointments for {date}", spinner="earth"):
-        appts = api.get_appointments(date)
+        raw = get_source(from_file).get_raw_appointments(date)
 
-    if len(appts) == 0:
+    if len(raw) == 0:
         console.print(f"No appointments to schedule for {date} :calendar:")
         sys.exit(0)
 
-    try:
-        vax_appts = [
-            VaxAppointment.from_acuity(appt)
-            for appt in appts
-            if appt.vax_note is not ErrorNote.INVALID_FORM
-        ]
-
-    except ValidationError:
-        console.print("[red bold]Error with Acuity data export[/red bold]")
-        console.print(
-            f"Run [yellow]vaxup check {date} --fix[/yellow] to fix interactively"
-        )
-        sys.exit(1)
+    # Only the compact copy is kept while registering
+    vax_appts = AppointmentStore()
+    for appt, vax_appt, issue_fields in validate_appointments(
+        raw, jobs=jobs, field_ids=field_ids(get_source(from_file))
+    ):
+        if appt.vax_note is ErrorNote.INVALID_FORM:
+            continue
+        if issue_fields:
+            console.print("[red bold]Error with Acuity data export[/red bold]")
+            console.print(
+                f"Run [yellow]vaxup check {date} --fix[/yellow] to fix interactively"
+            )
+            sys.exit(1)
+        vax_appts.append(vax_appt)
+    del raw
+
+    # Cached rules are checked before the browser starts
+    rules = FormRules.load() if preflight_rules else None
+    invalid = (
+        preflight(rules, vax_appts, tag=not dry_run) if rules is not None else set()
+    )
 
     username, password = get_vax_login()
 
     with console.status("Initialing web-driver...") as status:
-        with AuthorizedEnroller(username, password, dry_run) as enroller:
-            for location, location_appts in groupby_location(vax_appts=vax_appts):
+        with AuthorizedEnroller(
+            username,
+            password,
+            dry_run,
+            session_cache=session_cache,
+            browser_profile=browser_profile,
+        ) as enroller:
+            if preflight_rules and rules is None:
+                # Scraped through the slot of the first appointment to register
+                first = next(
+                    (e for e in vax_appts if not skip_reason(e, duplicate_ids)), None
+                )
+                if first is not None:
+                    status.update(status="Reading VAX form rules...")
+                    try:
+                        rules = FormRules.scrape(enroller, first)
+                        rules.save()
+                        # Only logged: nothing has checked a fresh scrape yet,
+                        # so appointments are skipped from the next run on
+                        preflight(rules, vax_appts)
+                    except Exception as e:
+                        console.log(
+                            f"[yellow bold]WARNING[/yellow bold] failed to read VAX form rules: {e}"
+                        )
+
+            unavailable = (
+                prescan(
+                    enroller,
+                    [
+                        e
+                        for e in vax_appts
+                        if e.id not in duplicate_ids and e.id not in invalid
+                    ],
+                    tag=tag_unavailable and not dry_run,
+                )
+                if prescan_times
+                else set()
+            )
+
+            if queue is not None:
+                work = WorkQueue(queue)
+                work.add(
+                    e
+                    for e in vax_appts
+                    if not skip_reason(e, duplicate_ids, unavailable, invalid)
+                )
                 status.update(
-                    status=f"[yellow]Registering applicant(s) for {location.name}[/yellow]",
+                    status=f"[yellow]Registering applicant(s) from {queue}[/yellow]",
                     spinner="bouncingBall",
                     spinner_style="yellow",
                 )
-                for vax_appt in location_appts:
-
-                    def msg(tag: str, color: str, data=None):
-                        line = f"{location.name} {vax_appt.id} {vax_appt.time_str}"
-                        line = f"[{color} bold]{tag}[/{color} bold]\t- {line}"
-                        return line if not data else line + f" - {data}"
-
-                    if vax_appt.canceled:
-                        console.log(
-                            msg(
-                                "Skipped",
-                                "yellow",
-                                "Appointment is canceled on Acuity.",
-                            )
-                        )
-                    elif vax_appt.vax_appointment_id:
-                        console.log(
-                            msg(
-                                "Skipped",
-                                "yellow",
-                                f"Appt #: {vax_appt.vax_appointment_id}",
-                            )
-                        )
-                    elif vax_appt.vax_note is not ErrorNote.NONE:
-                        console.log(
-                            msg(
-                                "Skipped",
-                                "yellow",
-                                f"[bold yellow]{vax_appt.vax_note.value}",
-                            )
-                        )
-                    else:
-                        try:
-                            vax_id = enroller.schedule_appointment(appt=vax_appt)
-                            console.log(
-                                msg(
-                                    "Success", "green", f"Appt #: {vax_id or 'DRY_RUN'}"
-                                )
-                            )
-                            if not dry_run:
-                                api.set_vax_id(id=vax_appt.id, vax_id=vax_id)
-                        except HTTPError as e:
+                worker = worker or f"{socket.gethostname()}-{os.getpid()}"
+                enroll_from_queue(enroller, work, date, worker, dry_run=dry_run)
+            else:
+                for location, location_appts in groupby_location(vax_appts=vax_appts):
+                    status.update(
+                        status=f"[yellow]Registering applicant(s) for {location.name}[/yellow]",
+                        spinner="bouncingBall",
+                        spinner_style="yellow",
+                    )
+                    for vax_appt in location_appts:
+                        if reason := skip_reason(
+                            vax_appt, duplicate_ids, unavailable, invalid
+                        ):
                             console.log(
-                                f"[yellow bold]WARNING[/yellow bold] failed tag {vax_appt.id} with Appointment #: {vax_id} on Acuity, but VAX registration was sucessful."
+                                enroll_msg(vax_appt, "Skipped", "yellow", reason)
                             )
-                        except Exception as e:
-                            console.log(msg("Failure", "red"))
-                            console.log(e)
-                            console.print(vax_appt)
+                        else:
+                            register(enroller, vax_appt, dry_run=dry_run)
+
+            timeouts = ", ".join(
+                f"{step} {seconds:.1f}s"
+                for step, seconds in sorted(enroller.latency.chosen.items())
+            )
+            console.log(f"[bold]Timeouts[/bold] {timeouts}")
+
+
+def export(start: datetime.date, end: Optional[datetime.date], output: Path) -> None:
+    end = end or start
+    with console.status(
+        f"Exporting appointments for {start} to {end}", spinner="earth"
+    ):
+        num_appts = write_snapshot(
+            output,
+            (
+                record
+                for canceled in (False, True)
+                for record in api.iter_raw_appointments(
+                    start, canceled=canceled, end=end
+                )
+            ),
+        )
+    console.print(f"Wrote {num_appts} appointments to [bold]{output}[/bold]")
 
 
-def unenroll(acuity_id: int) -> None:
+def unenroll(
+    acuity_id: int,
+    session_cache: bool = True,
+    browser_profile: BrowserProfile = "fast",
+) -> None:
     with console.status(f"Fetching appointment for id: {acuity_id}", spinner="earth"):
         appt = api.get_appointment(acuity_id)
 
@@ -251,7 +833,12 @@ def unenroll(acuity_id: int) -> None:
     username, password = get_vax_login()
 
     with console.status("Initialing web-driver...") as status:
-        with AuthorizedEnroller(username=username, password=password) as enroller:
+        with AuthorizedEnroller(
+            username=username,
+            password=password,
+            session_cache=session_cache,
+            browser_profile=browser_profile,
+        ) as enroller:
             status.update("Cancelling ")
             try:
                 enroller.cancel_appointment(appt=vax_appt)
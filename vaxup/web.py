@@ -1,7 +1,10 @@
+import shutil
+import tempfile
 from time import sleep
-from typing import Optional
+from typing import Any, Callable, Literal, Optional
 
 from selenium import webdriver
+from selenium.common.exceptions import NoSuchElementException, WebDriverException
 from selenium.webdriver.common.by import By
 from selenium.webdriver.common.keys import Keys
 from selenium.webdriver.remote.webelement import WebElement
@@ -10,6 +13,9 @@ from selenium.webdriver.support.ui import WebDriverWait
 
 from .acuity import Location
 from .data import Ethnicity, Gender, Race, Sex, VaxAppointment
+from .latency import LatencyModel
+from .profiling import instrument_driver
+from .session import SessionCache
 
 URL = "https://vaxmgmt.force.com/authorizedEnroller/s/"
 LOGIN_URL = f"{URL}login/"
@@ -77,12 +83,73 @@ ETHNICITY = {
     Ethnicity.PERFER_NOT_TO_ANSWER: "Prefer not to answer",
 }
 
+BrowserProfile = Literal["default", "fast"]
+
+
+class EnrollError(Exception):
+    """Raised when VAX refuses an appointment for a known reason."""
+
+
+class SlotUnavailable(EnrollError):
+    """The time slot is no longer offered for the date and location."""
+
+
+class SessionExpired(EnrollError):
+    """VAX sent the browser back to the login page."""
+
+
+class FormRejected(EnrollError):
+    """VAX flagged fields of the personal information form as invalid."""
+
+
+class SubmitUnconfirmed(EnrollError):
+    """Submitted, but no appointment number was shown.
+
+    The appointment may be registered on VAX, so it must not be retried.
+    """
+
+
+# Resources never needed to fill out forms, blocked with the "fast" profile.
+# Images are disabled separately through Chrome preferences.
+BLOCKED_URLS = [
+    "*.woff",
+    "*.woff2",
+    "*.ttf",
+    "*.otf",
+    "*google-analytics.com*",
+    "*googletagmanager.com*",
+    "*doubleclick.net*",
+    "*facebook.net*",
+    "*hotjar.com*",
+]
+
+
+def chrome_options(
+    profile: BrowserProfile = "fast", user_data_dir: Optional[str] = None
+) -> webdriver.ChromeOptions:
+    options = webdriver.ChromeOptions()
+    if profile == "fast":
+        # Return from `driver.get` once the DOM is ready, rather than waiting
+        # for every resource. Elements are found through implicit waits.
+        options.page_load_strategy = "eager"
+        options.add_argument("--disable-extensions")
+        options.add_argument("--disable-gpu")
+        if user_data_dir is not None:
+            options.add_argument(f"--user-data-dir={user_data_dir}")
+        options.add_experimental_option(
+            "prefs", {"profile.managed_default_content_settings.images": 2}
+        )
+    return options
+
 
 class AuthorizedEnroller:
     _username: str
     _password: str
     _test: bool
     _current_location: Optional[Location]
+    _session_cache: Optional[SessionCache]
+    _user_data_dir: Optional[str]
+    latency: LatencyModel
     driver: webdriver.Chrome
 
     def __init__(
@@ -90,32 +157,75 @@ class AuthorizedEnroller:
         username: str,
         password: str,
         test: bool = False,
+        session_cache: bool = True,
+        browser_profile: BrowserProfile = "fast",
     ):
         self._username = username
         self._password = password
         self._test = test
         self._current_location = None
-        self.driver = webdriver.Chrome()
+        self._session_cache = (
+            SessionCache(username, password) if session_cache else None
+        )
+        self.latency = LatencyModel()
+        # One throwaway profile per browser: Chrome locks its profile, so
+        # bots on the same host can't share one, and cookies must only be
+        # persisted (encrypted) through the session cache.
+        self._user_data_dir = (
+            tempfile.mkdtemp(prefix="vaxup-chrome-")
+            if browser_profile == "fast"
+            else None
+        )
+        self.driver = webdriver.Chrome(
+            options=chrome_options(browser_profile, self._user_data_dir)
+        )
+        instrument_driver(self.driver)
+
+        if browser_profile == "fast":
+            self.driver.execute_cdp_cmd("Network.enable", {})
+            self.driver.execute_cdp_cmd(
+                "Network.setBlockedURLs", {"urls": BLOCKED_URLS}
+            )
 
         # Defaults for driver
         self.driver.set_window_position(0, 0)
         self.driver.set_window_size(1024, 900)
-        self.driver.implicitly_wait(5)
+        self.driver.implicitly_wait(self.latency.timeout("element"))
 
     def __enter__(self):
         return self
 
     def __exit__(self, *args):
-        self.driver.close()
+        self.latency.save()
+        # Quit rather than close, so Chrome lets go of its profile
+        self.driver.quit()
+        if self._user_data_dir is not None:
+            shutil.rmtree(self._user_data_dir, ignore_errors=True)
 
     def _find_element(self, xpath: str) -> WebElement:
-        return self.driver.find_element(By.XPATH, xpath)
+        with self.latency.measure("element", self._current_location):
+            return self.driver.find_element(By.XPATH, xpath)
+
+    def _wait(
+        self,
+        step: str,
+        condition: Callable,
+        message: str = "",
+        location: Optional[Location] = None,
+    ):
+        # Explicit wait with a timeout learned from previous runs
+        with self.latency.measure(step, location):
+            return WebDriverWait(
+                self.driver,
+                self.latency.timeout(step, location),
+                poll_frequency=self.latency.poll_frequency(step, location),
+            ).until(condition, message)
 
     def _select_location(self, location: Location) -> None:
         data_id = LOCATION[location]
         self._find_element(f"//lightning-button[@data-id='{data_id}']").click()
 
-    def _select_date(self, date: str, time: str, location: Location) -> None:
+    def _goto_date(self, date: str) -> None:
         # Checks if date in middle of page matches our desired date.
         # If not, we need to input a new timestamp and wait until the server
         # responds with new options.
@@ -130,14 +240,26 @@ class AuthorizedEnroller:
             date_picker.send_keys(date)
             date_picker.send_keys(Keys.RETURN)
 
-            WebDriverWait(self.driver, 10).until(date_matches)
+            self._wait("select_date", date_matches, location=self._current_location)
             sleep(0.5)
 
+    def _select_date(self, date: str, time: str, location: Location) -> None:
+        self._goto_date(date)
+
         # Find time slot and click
         # Time must be formatted: HH:MM AM/PM
-        self._find_element(
-            f"//div[@aria-label='{APPT_CARD[location]}']//child::lightning-formatted-time[text()='{time}']"
-        ).click()
+        card = f"//div[@aria-label='{APPT_CARD[location]}']"
+        try:
+            self._find_element(
+                f"{card}//child::lightning-formatted-time[text()='{time}']"
+            ).click()
+        except NoSuchElementException:
+            # Other times showing means the page loaded, so the slot is gone
+            if self.driver.find_elements(
+                By.XPATH, f"{card}//child::lightning-formatted-time"
+            ):
+                raise SlotUnavailable(f"{time} on {date} is no longer offered.")
+            raise
 
     def _click_next(self, first: bool = False) -> None:
         path = "//section/button"
@@ -202,6 +324,19 @@ class AuthorizedEnroller:
         # Race checkbox
         find_label("races", RACE[appt.race]).click()
 
+    def _form_errors(self) -> list[str]:
+        # Labels of fields VAX marked as invalid, without waiting for any
+        self.driver.implicitly_wait(0)
+        try:
+            elements = self.driver.find_elements(
+                By.XPATH, "//*[contains(@class, 'slds-has-error')]//label"
+            )
+            return [el.text for el in elements]
+        finally:
+            self.driver.implicitly_wait(
+                self.latency.timeout("element", self._current_location)
+            )
+
     def _health_insurance(self, has_health_insurance: bool) -> None:
         tmp = "//input[@name='{}' and @value='{}']/following-sibling::label"
         if has_health_insurance:
@@ -214,36 +349,83 @@ class AuthorizedEnroller:
         el = self._find_element("//*[contains(text(),'Appointment #')]")
         return el.text.lstrip("Appointment #:")
 
-    # Explicit login to location
-    def _login(self, location: Location):
+    def _authenticate(self) -> None:
         self.driver.get(LOGIN_URL)
         self._find_element("//input[@id='emailAddress-0']").send_keys(self._username)
         self._find_element("//input[@id='loginPassword-0']").send_keys(self._password)
         self._find_element("//lightning-button/button[text()='Log in']").click()
-        WebDriverWait(self.driver, 15).until(
-            lambda d: d.current_url == URL, "Failed to login."
-        )
+        self._wait("login", lambda d: d.current_url == URL, "Failed to login.")
+        if self._session_cache:
+            self._session_cache.save(self.driver.get_cookies())
+
+    def _restore_session(self) -> bool:
+        # Reuses cached session cookies from a previous login. Only succeeds
+        # if VAX lands on location selection rather than the login page.
+        cookies = self._session_cache.load() if self._session_cache else None
+        if not cookies:
+            return False
+
+        # Cookies can only be set for the domain currently loaded
+        self.driver.get(LOGIN_URL)
+        self.driver.delete_all_cookies()
+        for cookie in cookies:
+            try:
+                self.driver.add_cookie(cookie)
+            except WebDriverException:
+                pass
+
+        self.driver.get(URL)
+        if self.driver.current_url == URL and self.driver.find_elements(
+            By.XPATH, "//lightning-button[@data-id]"
+        ):
+            return True
+
+        self._session_cache.clear()
+        self.driver.delete_all_cookies()
+        return False
+
+    def expire_session(self) -> None:
+        # Forces a full login before the next appointment
+        self._current_location = None
+        if self._session_cache:
+            self._session_cache.clear()
+
+    # Explicit login to location
+    def _login(self, location: Location):
+        if not self._restore_session():
+            self._authenticate()
 
         self._select_location(location=location)
-        WebDriverWait(self.driver, 15).until(
+        self._wait(
+            "select_location",
             EC.presence_of_element_located((By.XPATH, TIME_STAMP_XPATH)),
             "Failed to select location.",
+            location=location,
         )
         self._current_location = location
+        self.driver.implicitly_wait(self.latency.timeout("element", location))
 
-    def schedule_appointment(self, appt: VaxAppointment):
-        if appt.canceled:
-            raise ValueError("Appointment is canceled on Acuity.")
-
-        if appt.vax_appointment_id is not None:
-            raise ValueError("Appointment already registered on VAX.")
-
+    def _open_location(self, location: Location) -> None:
         # implicit login if current location doesn't match
-        if appt.location != self._current_location:
-            self._login(location=appt.location)
+        if location != self._current_location:
+            self._login(location=location)
         else:
             self.driver.get(URL)
 
+    def available_times(self, location: Location, date: str) -> set[str]:
+        # Loads the appointment card for a location and date once and
+        # returns every bookable time slot, formatted HH:MM AM/PM.
+        self._open_location(location=location)
+        self._goto_date(date)
+        elements = self.driver.find_elements(
+            By.XPATH,
+            f"//div[@aria-label='{APPT_CARD[location]}']//child::lightning-formatted-time",
+        )
+        return {el.text for el in elements}
+
+    def _goto_personal_information(self, appt: VaxAppointment) -> None:
+        self._open_location(location=appt.location)
+
         self._select_date(
             date=appt.date_str, time=appt.time_str, location=appt.location
         )
@@ -255,15 +437,69 @@ class AuthorizedEnroller:
         self._select_health_screening()
         self._click_next()
 
-        self._fill_personal_information(appt=appt)
-        self._click_next()
+    def scrape_form_rules(self, appt: VaxAppointment) -> dict[str, Any]:
+        # Opens the personal information form through the time slot of `appt`
+        # (without filling it) and reads the constraints VAX enforces: input
+        # `pattern`/`maxlength`/`minlength` attributes and dropdown options.
+        self._goto_personal_information(appt=appt)
+
+        inputs = {}
+        for el in self.driver.find_elements(By.XPATH, "//input[@name]"):
+            attrs = {
+                attr: el.get_attribute(attr)
+                for attr in ("pattern", "maxlength", "minlength")
+            }
+            inputs[el.get_attribute("name")] = {k: v for k, v in attrs.items() if v}
+
+        options = {}
+        for name in ("state", "ethencity", "sex", "gender"):
+            el = self._find_element(f"//input[@name='{name}']")
+            el.click()
+            items = self.driver.find_elements(
+                By.XPATH,
+                f"//div[@id='{el.get_attribute('aria-controls')}']"
+                "/child::lightning-base-combobox-item",
+            )
+            options[name] = [item.get_attribute("data-value") for item in items]
+            el.send_keys(Keys.ESCAPE)
+
+        options["races"] = [
+            el.get_attribute("value")
+            for el in self.driver.find_elements(By.XPATH, "//input[@name='races']")
+        ]
+        return {"inputs": inputs, "options": options}
 
-        self._health_insurance(has_health_insurance=appt.has_health_insurance)
+    def schedule_appointment(self, appt: VaxAppointment):
+        if appt.canceled:
+            raise ValueError("Appointment is canceled on Acuity.")
 
-        # Submit
-        if not self._test:
+        if appt.vax_appointment_id is not None:
+            raise ValueError("Appointment already registered on VAX.")
+
+        try:
+            self._goto_personal_information(appt=appt)
+
+            self._fill_personal_information(appt=appt)
             self._click_next()
-            return self._get_appt_id()
+
+            try:
+                self._health_insurance(has_health_insurance=appt.has_health_insurance)
+            except NoSuchElementException:
+                if errors := self._form_errors():
+                    raise FormRejected(f"Invalid fields: {', '.join(errors)}")
+                raise
+        except WebDriverException:
+            if self.driver.current_url.startswith(LOGIN_URL):
+                raise SessionExpired("Redirected to login.")
+            raise
+
+        # Submit. Nothing after this point may be retried.
+        if not self._test:
+            try:
+                self._click_next()
+                return self._get_appt_id()
+            except WebDriverException as e:
+                raise SubmitUnconfirmed(str(e)) from e
 
     def cancel_appointment(self, appt: VaxAppointment):
         if appt.vax_appointment_id is None:
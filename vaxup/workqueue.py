@@ -0,0 +1,193 @@
+import sqlite3
+import threading
+import time
+from contextlib import closing, contextmanager
+from pathlib import Path
+from typing import Iterable, Iterator, Optional, Union
+
+from rich.console import Console
+
+from .acuity import Location
+from .data import VaxAppointment
+
+# Seconds a worker holds an appointment without a heartbeat before
+# another worker may take it over.
+LEASE_SECONDS = 120
+
+# Leases granted for an appointment before it is marked as failed.
+MAX_ATTEMPTS = 3
+
+# Heartbeat problems go to stderr, next to the worker's own output
+console = Console(stderr=True)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY,
+    date TEXT NOT NULL,
+    location TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    vax_id TEXT,
+    error TEXT,
+    updated REAL
+);
+CREATE INDEX IF NOT EXISTS appointments_date_status
+    ON appointments (date, status);
+"""
+
+
+class WorkQueue:
+    """Acuity appointments to register on VAX, shared between workers.
+
+    Backed by a single SQLite file, which may live on a disk shared by
+    several hosts as long as it supports file locking. Each worker leases
+    appointments by Acuity id, heartbeats while registering, and then
+    completes or releases them. A lease that is not renewed expires, so
+    appointments held by a crashed worker are picked up by the others.
+    """
+
+    def __init__(self, path: Union[str, Path], lease_seconds: float = LEASE_SECONDS):
+        self.path = Path(path)
+        self.lease_seconds = lease_seconds
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        # Short-lived connections keep the queue usable from any thread
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+        with closing(conn):
+            yield conn
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        with self._connect() as conn:
+            # Take the write lock up front so concurrent leases serialize
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield conn
+                conn.execute("COMMIT")
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+
+    def add(self, appts: Iterable[VaxAppointment]) -> int:
+        # Appointments already in the queue (by any worker) are left as is
+        now = time.time()
+        rows = [
+            (a.id, a.datetime.date().isoformat(), a.location.name, now) for a in appts
+        ]
+        with self._transaction() as conn:
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO appointments (id, date, location, updated) "
+                "VALUES (?, ?, ?, ?)",
+                rows,
+            )
+            return conn.total_changes - before
+
+    def lease(
+        self,
+        worker: str,
+        date: str,
+        location: Optional[Location] = None,
+        limit: int = 1,
+    ) -> list[int]:
+        # Prefers appointments at `location` to avoid logging in again
+        now = time.time()
+        with self._transaction() as conn:
+            ids = [
+                id
+                for (id,) in conn.execute(
+                    "SELECT id FROM appointments WHERE date = ? AND ("
+                    "   status = 'pending' OR "
+                    "   (status = 'leased' AND lease_expires < ?)"
+                    ") ORDER BY location = ? DESC, location, id LIMIT ?",
+                    (date, now, location.name if location else None, limit),
+                )
+            ]
+            conn.executemany(
+                "UPDATE appointments SET status = 'leased', worker = ?, "
+                "lease_expires = ?, attempts = attempts + 1, updated = ? "
+                "WHERE id = ?",
+                [(worker, now + self.lease_seconds, now, id) for id in ids],
+            )
+        return ids
+
+    def _update(self, id: int, worker: str, sql: str, *params) -> bool:
+        # Only the current lease holder may change an appointment
+        with self._transaction() as conn:
+            cur = conn.execute(
+                f"UPDATE appointments SET {sql}, updated = ? "
+                "WHERE id = ? AND worker = ? AND status = 'leased'",
+                (*params, time.time(), id, worker),
+            )
+            return cur.rowcount == 1
+
+    def renew(self, id: int, worker: str) -> bool:
+        return self._update(
+            id, worker, "lease_expires = ?", time.time() + self.lease_seconds
+        )
+
+    def complete(self, id: int, worker: str, vax_id: Optional[str] = None) -> bool:
+        return self._update(
+            id, worker, "status = 'done', lease_expires = NULL, vax_id = ?", vax_id
+        )
+
+    def release(self, id: int, worker: str, error: Optional[str] = None) -> bool:
+        # Hands the appointment back to the queue, or gives up on it once
+        # it has been attempted `MAX_ATTEMPTS` times.
+        return self._update(
+            id,
+            worker,
+            "status = CASE WHEN attempts < ? THEN 'pending' ELSE 'failed' END, "
+            "lease_expires = NULL, error = ?",
+            MAX_ATTEMPTS,
+            error,
+        )
+
+    def fail(self, id: int, worker: str, error: Optional[str] = None) -> bool:
+        # Gives up on the appointment without handing it back, for failures
+        # that may have registered it on VAX already.
+        return self._update(
+            id, worker, "status = 'failed', lease_expires = NULL, error = ?", error
+        )
+
+    def counts(self, date: str) -> dict[str, int]:
+        with self._connect() as conn:
+            return dict(
+                conn.execute(
+                    "SELECT status, count(*) FROM appointments "
+                    "WHERE date = ? GROUP BY status",
+                    (date,),
+                )
+            )
+
+    @contextmanager
+    def heartbeat(self, ids: Iterable[int], worker: str) -> Iterator[None]:
+        # Renews leases in the background while the body runs. Appointments
+        # completed or released in the meantime are no longer renewed. A
+        # failed renewal (e.g. the database stayed locked) is logged and
+        # tried again on the next beat, while the lease may still be valid.
+        ids = list(ids)
+        stop = threading.Event()
+
+        def beat():
+            while not stop.wait(self.lease_seconds / 3):
+                for id in ids:
+                    try:
+                        self.renew(id, worker)
+                    except sqlite3.Error as e:
+                        console.log(
+                            f"[yellow bold]WARNING[/yellow bold] failed to renew lease on {id}: {e}"
+                        )
+
+        thread = threading.Thread(target=beat, daemon=True)
+        thread.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            thread.join()